@@ -0,0 +1,98 @@
+import threading
+import logging
+from indicators import analyze_incremental
+from cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+
+class SymbolAnalysisCache:
+    """按股票代码共享的技术分析结果缓存
+
+    技术指标只取决于股票的日线，与持有它的用户无关：结果按股票代码缓存，
+    并以本地日线的同步版本（最后一根K线日期 + 同步时间）作为失效依据。
+    日线未更新时直接复用结果，多个用户持有同一只股票时每个同步周期只计算一次。
+    结果以 (股票代码, 日线版本) 为key存放在有界LRU缓存中，旧版本的结果随LRU淘汰。
+    """
+
+    def __init__(self, history_store, min_bars=20, cache=None):
+        """
+        Args:
+            history_store: HistoryStore，日线的来源
+            min_bars: 计算技术指标所需的最少K线数量
+            cache: 进程内缓存（cache.TTLCache），默认使用 'analysis' 命名空间
+        """
+        self.history_store = history_store
+        self.min_bars = min_bars
+        self._entries = cache if cache is not None else get_cache('analysis')
+        self._compute_lock = threading.Lock()
+
+    def _lookup(self, versions):
+        """按版本查找缓存，返回 (命中的结果, 需要重新计算的股票代码)"""
+        hits = {}
+        misses = []
+        for symbol, version in versions.items():
+            entry = self._entries.get((symbol, version)) if version is not None else None
+            if entry is not None:
+                hits[symbol] = entry
+            else:
+                misses.append(symbol)
+        return hits, misses
+
+    def _compute(self, symbols, versions):
+        """读取日线并计算技术指标，结果写入缓存"""
+        histories = self.history_store.read_many(symbols)
+        eligible = {symbol: df for symbol, df in histories.items() if len(df) >= self.min_bars}
+        try:
+            # 已有指标状态的股票按新K线O(1)推进；其余股票对齐为二维数组一次向量化计算，并建立状态
+            states = self.history_store.load_indicator_states(eligible.keys())
+            analyses, states = analyze_incremental(eligible, states, min_bars=self.min_bars)
+            self.history_store.save_indicator_states(states)
+        except Exception as e:
+            logger.error(f"批量计算技术指标失败: {str(e)}")
+            return {}
+
+        entries = {}
+        for symbol in symbols:
+            daily_data = histories.get(symbol)
+            analysis_result = analyses.get(symbol)
+            avg_volume = None
+            if analysis_result is not None and 'vol' in daily_data.columns:
+                avg_volume = float(daily_data['vol'].mean())
+            entries[symbol] = {
+                'version': versions.get(symbol),
+                'analysis_result': analysis_result,
+                'avg_volume': avg_volume
+            }
+        for symbol, entry in entries.items():
+            if entry['version'] is not None:
+                self._entries.set((symbol, entry['version']), entry)
+        return entries
+
+    def get_many(self, symbols, sync=True):
+        """获取多只股票的技术分析结果
+
+        Args:
+            symbols: 股票代码列表
+            sync: 是否先尝试增量同步日线
+
+        Returns:
+            dict: 股票代码 -> {'analysis_result', 'avg_volume'}，
+                  K线不足时 analysis_result 为None
+        """
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return {}
+        if sync:
+            self.history_store.sync_many(symbols)
+
+        hits, misses = self._lookup(self.history_store.bar_versions(symbols))
+        if misses:
+            # 同一时刻只有一个请求在计算，等待期间其他请求可能已经算好了相同的股票
+            with self._compute_lock:
+                versions = self.history_store.bar_versions(misses)
+                recheck, misses = self._lookup(versions)
+                hits.update(recheck)
+                if misses:
+                    hits.update(self._compute(misses, versions))
+        return hits
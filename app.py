@@ -18,20 +18,37 @@
 # 2. 指标选择: 当前系统更注重市场数据(价格/成交量/换手率)，@StockAnalysis更注重技术指标
 # 3. 评分阈值: 当前系统有更多的阈值档位，@StockAnalysis只有单一阈值
 
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session, Response, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
+import click
 import pandas as pd
-import numpy as np
 from datetime import datetime, timedelta, timezone
 import requests
 import time
+import threading
 import akshare as ak
 import json
-from models import db, User, LoginLog, UserPortfolio, get_beijing_time
+import gzip
+import hashlib
+from models import db, User, LoginLog, UserPortfolio, SymbolSnapshot, get_beijing_time
+import login_stats
+import login_logs
+from shared_cache import create_store, SharedValue
+from cache import get_cache, register_cache, cache_stats, cached
+from login_audit import LoginAuditWriter, DURABILITY_BUFFERED
+from market_data import SnapshotRefresher
+from history_store import HistoryStore
+from fundamentals import FundamentalsCache
+from data_provider import get_rate_limiter, Deadline, run_with_deadline
+from indicators import calculate_indicators, analyze_indicators
+from analysis_cache import SymbolAnalysisCache
+from portfolio_pipeline import PortfolioPipeline, QUOTE_FIELDS, SCORE_FIELDS
+from chart_data import parse_series, chart_columns, to_json_columns, to_float32_buffer, json_safe
+from refresh_jobs import RefreshJobManager, STATUS_DONE, STATUS_NO_QUOTE, STATUS_ERROR, STATUS_PENDING
 from forms import LoginForm, RegistrationForm, UserSettingsForm
 import asyncio
 import concurrent.futures
@@ -45,7 +62,7 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-please-change-in-production')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///app.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # 初始化扩展
@@ -66,12 +83,17 @@ def load_user(user_id):
 with app.app_context():
     db.create_all()
 
-# 公网IP缓存
-public_ip_cache = {
-    'ip': None,
-    'timestamp': 0,
-    'expires': 3600  # 缓存有效期1小时
-}
+# 登录审计记录：buffered 为后台批量写入（默认），sync 为请求内同步写入
+LOGIN_AUDIT_DURABILITY = os.environ.get('LOGIN_AUDIT_DURABILITY', DURABILITY_BUFFERED)
+LOGIN_AUDIT_QUEUE_SIZE = int(os.environ.get('LOGIN_AUDIT_QUEUE_SIZE', 10000))
+LOGIN_AUDIT_FLUSH_INTERVAL = float(os.environ.get('LOGIN_AUDIT_FLUSH_INTERVAL', 0.5))
+
+login_audit_writer = LoginAuditWriter(
+    app,
+    durability=LOGIN_AUDIT_DURABILITY,
+    max_queue=LOGIN_AUDIT_QUEUE_SIZE,
+    flush_interval=LOGIN_AUDIT_FLUSH_INTERVAL
+)
 
 # 辅助函数获取客户端真实IP
 def get_client_ip(try_public_ip=False):
@@ -120,20 +142,8 @@ def login():
             client_ip = get_client_ip(try_public_ip=True)
             user_agent = request.headers.get('User-Agent', '')
             
-            # 创建登录日志
-            login_log = LoginLog(
-                user_id=user.id,
-                ip_address=client_ip,
-                user_agent=user_agent,
-                status='success',
-                login_time=get_beijing_time()  # 明确指定使用北京时间
-            )
-            db.session.add(login_log)
-            
-            # 更新用户最后登录信息
-            user.last_login_at = get_beijing_time()
-            user.last_login_ip = client_ip
-            db.session.commit()
+            # 登录日志和最后登录信息交给后写队列批量写入，不在请求中等待数据库写锁
+            login_audit_writer.record(user.id, client_ip, user_agent, 'success', get_beijing_time())
             
             next_page = request.args.get('next')
             flash('登录成功！', 'success')
@@ -149,15 +159,7 @@ def login():
             elif 'X-Real-IP' in request.headers:
                 client_ip = request.headers.get('X-Real-IP', '').strip()
             
-            login_log = LoginLog(
-                user_id=user.id,
-                ip_address=client_ip,
-                user_agent=request.headers.get('User-Agent', ''),
-                status='failed',
-                login_time=get_beijing_time()  # 明确指定使用北京时间
-            )
-            db.session.add(login_log)
-            db.session.commit()
+            login_audit_writer.record(user.id, client_ip, request.headers.get('User-Agent', ''), 'failed', get_beijing_time())
             
         flash('用户名或密码错误', 'danger')
     return render_template('login.html', form=form)
@@ -222,84 +224,164 @@ def user_settings():
 
 # 设置缓存
 CACHE_EXPIRATION = 60 * 10  # 缓存10分钟过期
-market_data_cache = {
-    'data': None,
-    'timestamp': 0
-}
+MARKET_REFRESH_INTERVAL = 60  # 行情后台刷新间隔（秒）
+
+# 多进程部署（如 gunicorn 多个 worker）时共享的缓存存储：file 为本机文件+文件锁，local 为进程内
+SHARED_CACHE_BACKEND = os.environ.get('SHARED_CACHE_BACKEND', 'file')
+SHARED_CACHE_DIR = os.environ.get('SHARED_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shared_cache'))
+shared_store = create_store(SHARED_CACHE_BACKEND, SHARED_CACHE_DIR)
+
+# 行情快照由后台线程定时刷新，请求只读取当前快照；所有进程共用一份快照，只有一个进程请求上游
+market_refresher = SnapshotRefresher(
+    ak.stock_zh_a_spot_em,
+    interval=MARKET_REFRESH_INTERVAL,
+    max_age=CACHE_EXPIRATION,
+    store=shared_store
+)
+
+# 日线批量同步的并发数和东方财富接口限流（每秒请求数/突发容量）
+HISTORY_FETCH_WORKERS = 8
+EASTMONEY_RATE_LIMIT = 5
+EASTMONEY_BURST = 10
 
-# 首页数据缓存
-dashboard_cache = {
-    'data': None,
-    'timestamp': 0
+# 本地日线库：只增量同步最新K线，页面从本地读取180天窗口
+history_store = HistoryStore(
+    ak.stock_zh_a_hist,
+    window_days=180,
+    sync_interval=CACHE_EXPIRATION,
+    max_workers=HISTORY_FETCH_WORKERS,
+    rate_limiter=get_rate_limiter('eastmoney', EASTMONEY_RATE_LIMIT, EASTMONEY_BURST)
+)
+
+# 进程内缓存的容量上限（条目数/估算字节数），统计信息见 /admin/cache-stats
+ANALYSIS_CACHE_ENTRIES = 5000
+ANALYSIS_CACHE_BYTES = 64 * 1024 * 1024
+FUNDAMENTALS_CACHE_ENTRIES = 5000
+FUNDAMENTALS_CACHE_BYTES = 32 * 1024 * 1024
+INDEX_DAILY_TTL = 30 * 60  # 指数日线缓存30分钟
+
+# 技术分析结果按股票代码共享，多个用户持有同一只股票时每个同步周期只计算一次
+analysis_cache = SymbolAnalysisCache(
+    history_store,
+    cache=get_cache('analysis', ttl=24 * 3600, max_entries=ANALYSIS_CACHE_ENTRIES, max_bytes=ANALYSIS_CACHE_BYTES)
+)
+
+# 财务摘要按报告期缓存，只在披露季或缺少应披露报告时向上游确认
+fundamentals_cache = FundamentalsCache(
+    ak.stock_financial_abstract,
+    cache=get_cache('fundamentals', max_entries=FUNDAMENTALS_CACHE_ENTRIES, max_bytes=FUNDAMENTALS_CACHE_BYTES)
+)
+
+# 首页数据缓存，所有进程共用，过期后只有一个进程重新获取
+dashboard_cache = SharedValue(shared_store, 'dashboard', CACHE_EXPIRATION)
+
+# 行情快照和首页数据需要跨进程单一刷新，不放入进程内LRU缓存，只登记统计信息
+register_cache('market', market_refresher)
+register_cache('dashboard', dashboard_cache)
+
+@cached('index_daily', ttl=INDEX_DAILY_TTL, max_entries=16)
+def get_index_daily(symbol):
+    """指数日线，盘中只有最后一根K线变化，首页趋势图按指数缓存"""
+    return ak.stock_zh_index_daily_em(symbol=symbol)
+
+# 详细分析页面的时间预算（秒）：超出预算的上游调用不再等待，直接使用本地已有数据
+ANALYSIS_DEADLINE = 3
+analysis_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix='analysis')
+
+# 首页各数据源共享的有界线程池，所有数据源并发获取
+DASHBOARD_MAX_WORKERS = 8
+dashboard_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=DASHBOARD_MAX_WORKERS,
+    thread_name_prefix='dashboard'
+)
+
+# 首页各数据源的超时时间（秒），超时的数据源使用默认值，其余数据照常返回
+DASHBOARD_SOURCE_TIMEOUTS = {
+    'index_spot': 10,
+    'industries': 10,
+    'market': 15,
+    'trend': 10
 }
 
 def load_portfolio(user_id):
     """加载用户投资组合
     
+    持仓和按股票代码共享的行情评分快照用一次联表查询读取，不解析JSON。
+    
     Args:
         user_id: 用户ID
         
     Returns:
         list: 用户的股票列表
     """
-    portfolio_items = UserPortfolio.query.filter_by(user_id=user_id).all()
+    rows = db.session.query(UserPortfolio.symbol, UserPortfolio.name, SymbolSnapshot).outerjoin(
+        SymbolSnapshot, SymbolSnapshot.symbol == UserPortfolio.symbol
+    ).filter(UserPortfolio.user_id == user_id).order_by(UserPortfolio.id).all()
     portfolio = []
     
-    for item in portfolio_items:
-        stock_data = item.get_stock_data()
-        # 确保基本信息存在
-        if not stock_data:
-            stock_data = {
-                "symbol": item.symbol,
-                "name": item.name
-            }
-        # 确保股票代码和名称是最新的
-        stock_data["symbol"] = item.symbol
-        stock_data["name"] = item.name
+    for symbol, name, snapshot in rows:
+        # 还没有快照的股票（刚添加、尚未刷新）同样包含全部字段
+        stock_data = snapshot.to_dict() if snapshot is not None else dict.fromkeys(SymbolSnapshot.FIELDS)
+        stock_data["symbol"] = symbol
+        stock_data["name"] = name
         portfolio.append(stock_data)
     
     return portfolio
 
-def save_portfolio(user_id, portfolio):
-    """保存用户投资组合
+def save_symbol_snapshots(stocks):
+    """保存股票的最新行情和评分，按股票代码共享
+    
+    按内容哈希比较，只批量写入有变化的股票；没有变化时不开启写事务，
+    页面浏览不会占用SQLite的写锁。
     
     Args:
-        user_id: 用户ID
-        portfolio: 用户的股票列表
+        stocks: 股票数据列表
+        
+    Returns:
+        int: 写入的股票数量
     """
-    # 获取用户当前的投资组合
-    current_items = UserPortfolio.query.filter_by(user_id=user_id).all()
-    current_symbols = {item.symbol: item for item in current_items}
+    stocks = {stock["symbol"]: stock for stock in stocks if stock.get("symbol")}
+    if not stocks:
+        return 0
     
-    # 处理新的投资组合
-    for stock in portfolio:
-        symbol = stock.get("symbol")
-        if not symbol:
-            continue
-            
-        # 检查是否已存在
-        if symbol in current_symbols:
-            # 更新现有记录
-            item = current_symbols[symbol]
-            item.name = stock.get("name", "")
-            item.set_stock_data(stock)
-            del current_symbols[symbol]  # 从待处理列表中移除
-        else:
-            # 添加新记录
-            item = UserPortfolio(
-                user_id=user_id,
-                symbol=symbol,
-                name=stock.get("name", "")
-            )
-            item.set_stock_data(stock)
-            db.session.add(item)
+    fields = SymbolSnapshot.FIELDS
+    rows = db.session.query(
+        SymbolSnapshot.symbol, *[getattr(SymbolSnapshot, field) for field in fields]
+    ).filter(SymbolSnapshot.symbol.in_(list(stocks))).all()
+    stored = {row[0]: SymbolSnapshot.content_hash(dict(zip(fields, row[1:]))) for row in rows}
     
-    # 删除不再存在的股票
-    for item in current_symbols.values():
-        db.session.delete(item)
+    inserts = []
+    updates = []
+    for symbol, stock in stocks.items():
+        if symbol not in stored:
+            inserts.append(SymbolSnapshot.to_mapping(symbol, stock))
+        elif stored[symbol] != SymbolSnapshot.content_hash(stock):
+            updates.append(SymbolSnapshot.to_mapping(symbol, stock))
     
-    # 保存更改
+    if inserts:
+        db.session.bulk_insert_mappings(SymbolSnapshot, inserts)
+    if updates:
+        db.session.bulk_update_mappings(SymbolSnapshot, updates)
+    # 没有待写入的变化时提交只结束读事务
     db.session.commit()
+    return len(inserts) + len(updates)
+
+def migrate_stock_data_to_snapshots():
+    """将旧版持仓JSON中的行情和评分迁移到共享快照（只处理还没有快照的股票）"""
+    items = UserPortfolio.query.outerjoin(
+        SymbolSnapshot, SymbolSnapshot.symbol == UserPortfolio.symbol
+    ).filter(SymbolSnapshot.symbol.is_(None), UserPortfolio.stock_data.isnot(None)).all()
+    stocks = {}
+    for item in items:
+        try:
+            stock_data = item.get_stock_data()
+        except ValueError:
+            continue
+        stock_data["symbol"] = item.symbol
+        stocks[item.symbol] = stock_data
+    if stocks:
+        save_symbol_snapshots(list(stocks.values()))
+        print(f"已将 {len(stocks)} 只股票的数据迁移到共享快照")
 
 def add_stock_to_portfolio(user_id, stock_data):
     """添加股票到用户投资组合
@@ -317,7 +399,6 @@ def add_stock_to_portfolio(user_id, stock_data):
     if existing:
         # 更新现有记录
         existing.name = stock_data.get("name", "")
-        existing.set_stock_data(stock_data)
     else:
         # 添加新记录
         item = UserPortfolio(
@@ -325,11 +406,10 @@ def add_stock_to_portfolio(user_id, stock_data):
             symbol=symbol,
             name=stock_data.get("name", "")
         )
-        item.set_stock_data(stock_data)
         db.session.add(item)
     
-    # 保存更改
-    db.session.commit()
+    # 行情和评分写入共享快照，与持仓一起提交
+    save_symbol_snapshots([stock_data])
     return True
 
 def remove_stock_from_portfolio(user_id, symbol):
@@ -346,25 +426,19 @@ def remove_stock_from_portfolio(user_id, symbol):
         return True
     return False
 
-def get_market_data():
-    """获取市场数据，带缓存"""
-    global market_data_cache
-    
-    current_time = time.time()
-    if (market_data_cache['data'] is None or 
-        current_time - market_data_cache['timestamp'] > CACHE_EXPIRATION):
-        try:
-            # 获取所有A股行情
-            market_data_cache['data'] = ak.stock_zh_a_spot_em()
-            market_data_cache['timestamp'] = current_time
-            print("更新市场数据缓存")
-        except Exception as e:
-            print(f"获取市场数据失败: {str(e)}")
-            # 如果获取失败但有缓存，继续使用缓存
-            if market_data_cache['data'] is not None:
-                print("使用过期缓存数据")
-                
-    return market_data_cache['data']
+def get_market_data(timeout=None):
+    """获取市场数据，带缓存
+
+    行情由后台刷新器定时更新，刷新期间返回上一版本快照；
+    仅在应用冷启动尚无快照时才会等待首次获取。
+
+    Args:
+        timeout: 冷启动时等待首次获取的最长时间（秒），None表示一直等待
+
+    Returns:
+        MarketSnapshot: 按股票代码索引的行情快照，获取失败且无缓存时返回None
+    """
+    return market_refresher.get(timeout=timeout)
 
 def calculate_stock_score(stock_data):
     """计算股票评分和投资建议（采用@StockAnalysis的评分逻辑）"""
@@ -474,6 +548,81 @@ def calculate_stock_score(stock_data):
             "volume_trend": "未知",
         }
 
+# 持仓批量估值流水线：/stocks、/refresh_stocks 和 /add_stock 共用
+portfolio_pipeline = PortfolioPipeline(history_store, analysis_cache, calculate_stock_score)
+
+# 后台刷新任务每批处理的股票数，每批完成后写入数据库并更新进度
+REFRESH_JOB_BATCH_SIZE = 5
+
+def run_refresh_job(job):
+    """在后台线程中分批刷新用户持仓"""
+    with app.app_context():
+        stocks = [stock for stock in load_portfolio(job.user_id) if stock['symbol'] in job.status]
+        market_data = get_market_data()
+        if market_data is None:
+            raise RuntimeError('无法获取市场数据')
+        
+        for i in range(0, len(stocks), REFRESH_JOB_BATCH_SIZE):
+            batch = stocks[i:i + REFRESH_JOB_BATCH_SIZE]
+            try:
+                portfolio_pipeline.run(batch, market_data)
+                save_symbol_snapshots(batch)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"刷新股票失败: {[stock['symbol'] for stock in batch]}, {str(e)}")
+                for stock in batch:
+                    job.complete(stock['symbol'], STATUS_ERROR)
+                job.publish()
+                continue
+            for stock in batch:
+                if stock['symbol'] in market_data:
+                    job.complete(stock['symbol'], STATUS_DONE, stock)
+                else:
+                    job.complete(stock['symbol'], STATUS_NO_QUOTE)
+            job.publish()
+        
+        # 刷新期间被删除的股票
+        for symbol, status in list(job.status.items()):
+            if status == STATUS_PENDING:
+                job.complete(symbol, STATUS_NO_QUOTE)
+
+# 任务进度写入共享存储，多进程部署时任一进程都能响应进度查询
+refresh_jobs = RefreshJobManager(run_refresh_job, store=shared_store)
+
+# 行情推送：无新快照时的心跳间隔（秒）、单个连接的最长时长（秒，到期后浏览器自动重连）、重连等待（毫秒）
+STREAM_HEARTBEAT = 15
+STREAM_MAX_DURATION = 120
+STREAM_RETRY_MS = 3000
+
+# 每个进程同时保持的推送连接数上限：每个连接占用一个工作线程，需使用 gthread/gevent 等工作模式，
+# 并保证该值小于每个进程的线程数，为普通请求留出线程
+STREAM_MAX_CONNECTIONS = int(os.environ.get('STREAM_MAX_CONNECTIONS', 8))
+stream_slots = threading.BoundedSemaphore(STREAM_MAX_CONNECTIONS)
+
+def portfolio_changes(portfolio, market_data, sent):
+    """按新快照重新估值持仓，返回与上次推送相比发生变化的股票
+    
+    Args:
+        portfolio: 持仓列表，会被就地更新
+        market_data: MarketSnapshot
+        sent: 股票代码 -> 上次推送的字段，会被就地更新
+        
+    Returns:
+        dict: 股票代码 -> 变化后的行情和评分
+    """
+    # 推送只读取本地日线和共享分析缓存，日线同步由持仓页面和刷新任务负责
+    portfolio_pipeline.run(portfolio, market_data, sync=False)
+    changes = {}
+    for stock in portfolio:
+        symbol = stock['symbol']
+        if symbol not in market_data:
+            continue
+        payload = {field: stock.get(field) for field in QUOTE_FIELDS + SCORE_FIELDS}
+        if sent.get(symbol) != payload:
+            sent[symbol] = payload
+            changes[symbol] = dict(payload, last_update=stock.get('last_update'))
+    return changes
+
 @app.route('/')
 def index():
     """首页路由，显示公开的信息页面"""
@@ -505,171 +654,151 @@ def get_dashboard_data(force_refresh=False):
     Args:
         force_refresh (bool): 是否强制刷新缓存
     """
-    global dashboard_cache
+    return dashboard_cache.get_or_compute(build_dashboard_data, force=force_refresh)
+
+def build_dashboard_data():
+    """并发获取首页各数据源，组装首页数据"""
+    # 获取指数数据
+    index_map = {
+        'sh': ['000001', 'sh000001', 'sh.000001', '上证指数'],
+        'sz': ['399001', 'sz399001', 'sz.399001', '深证成指'],
+        'cyb': ['399006', 'sz399006', 'sz.399006', '创业板指']
+    }
+    
+    # 先提交所有数据源并发获取，首页耗时约等于最慢的单个数据源
+    started = time.time()
+    futures = {
+        'index_spot': dashboard_executor.submit(ak.stock_zh_index_spot_sina),
+        'industries': dashboard_executor.submit(ak.stock_board_industry_name_em),
+        'market': dashboard_executor.submit(get_market_data)
+    }
+    for name, code_list in index_map.items():
+        # 使用第一个代码获取趋势数据
+        futures[f'trend_{name}'] = dashboard_executor.submit(get_index_daily, code_list[0])
+    
+    def source_result(key, timeout_key=None):
+        """等待数据源结果，超时时间从提交时开始计算"""
+        timeout = DASHBOARD_SOURCE_TIMEOUTS[timeout_key or key]
+        remaining = max(0, started + timeout - time.time())
+        try:
+            return futures[key].result(timeout=remaining)
+        except concurrent.futures.TimeoutError:
+            raise TimeoutError(f"数据源 {key} 超过 {timeout} 秒未返回")
     
-    current_time = time.time()
+    indices = {}
     
-    # 只有在以下情况才刷新缓存:
-    # 1. 缓存为空
-    # 2. 缓存过期
-    # 3. 强制刷新
-    if (dashboard_cache['data'] is None or 
-        current_time - dashboard_cache['timestamp'] > CACHE_EXPIRATION or
-        force_refresh):
+    # 使用新浪接口获取指数数据
+    try:
+        df = source_result('index_spot')
         
-        print(f"刷新缓存原因: 缓存为空={dashboard_cache['data'] is None}, 缓存过期={(current_time - dashboard_cache['timestamp'] > CACHE_EXPIRATION)}, 强制刷新={force_refresh}")
+        # 确保代码列是字符串类型
+        df['代码'] = df['代码'].astype(str)
         
-        try:
-            # 获取指数数据
-            index_map = {
-                'sh': ['000001', 'sh000001', 'sh.000001', '上证指数'],
-                'sz': ['399001', 'sz399001', 'sz.399001', '深证成指'],
-                'cyb': ['399006', 'sz399006', 'sz.399006', '创业板指']
-            }
-            
-            indices = {}
-            
-            # 使用新浪接口获取指数数据
-            try:
-                with concurrent.futures.ThreadPoolExecutor() as pool:
-                    df = pool.submit(ak.stock_zh_index_spot_sina).result()
-                
-                # 确保代码列是字符串类型
-                df['代码'] = df['代码'].astype(str)
-                
-                # 遍历每个指数
-                for name, code_list in index_map.items():
-                    found = False
-                    for code in code_list:
-                        try:
-                            # 尝试通过代码或名称匹配
-                            row = df[(df['代码'] == code) | (df['名称'] == code)]
-                            if not row.empty:
-                                row = row.iloc[0]
-                                indices[name] = {
-                                    'current': float(row['最新价']),
-                                    'change_pct': float(row['涨跌幅']),
-                                    'change': float(row['涨跌额'])
-                                }
-                                found = True
-                                break
-                        except Exception as e:
-                            logger.error(f"处理{name}指数数据失败: {str(e)}")
-                    
-                    if not found:
-                        logger.error(f"未找到{name}指数数据")
+        # 遍历每个指数
+        for name, code_list in index_map.items():
+            found = False
+            for code in code_list:
+                try:
+                    # 尝试通过代码或名称匹配
+                    row = df[(df['代码'] == code) | (df['名称'] == code)]
+                    if not row.empty:
+                        row = row.iloc[0]
                         indices[name] = {
-                            'current': 0,
-                            'change_pct': 0,
-                            'change': 0
+                            'current': float(row['最新价']),
+                            'change_pct': float(row['涨跌幅']),
+                            'change': float(row['涨跌额'])
                         }
-            except Exception as e:
-                logger.error(f"获取指数数据失败: {str(e)}")
-                for name in index_map.keys():
-                    indices[name] = {
-                        'current': 0,
-                        'change_pct': 0,
-                        'change': 0
-                    }
-        
-            # 获取行业板块数据
-            industries = []
-            try:
-                with concurrent.futures.ThreadPoolExecutor() as pool:
-                    df = pool.submit(ak.stock_board_industry_name_em).result()
-                
-                for _, row in df.head(5).iterrows():
-                    industries.append({
-                        'name': row['板块名称'],
-                        'change_pct': float(row['涨跌幅'])
-                    })
-            except Exception as e:
-                logger.error(f"获取行业板块数据失败: {str(e)}")
-                industries = []
-        
-            # 获取涨幅榜数据
-            gainers = []
-            try:
-                with concurrent.futures.ThreadPoolExecutor() as pool:
-                    df = pool.submit(ak.stock_zh_a_spot_em).result()
-                
-                for _, row in df.nlargest(5, '涨跌幅').iterrows():
-                    gainers.append({
-                        'name': row['名称'],
-                        'price': float(row['最新价']),
-                        'change_pct': float(row['涨跌幅'])
-                    })
-            except Exception as e:
-                logger.error(f"获取涨幅榜数据失败: {str(e)}")
-                gainers = []
+                        found = True
+                        break
+                except Exception as e:
+                    logger.error(f"处理{name}指数数据失败: {str(e)}")
             
-            # 获取跌幅榜数据
-            losers = []
-            try:
-                with concurrent.futures.ThreadPoolExecutor() as pool:
-                    df = pool.submit(ak.stock_zh_a_spot_em).result()
-                
-                for _, row in df.nsmallest(5, '涨跌幅').iterrows():
-                    losers.append({
-                        'name': row['名称'],
-                        'price': float(row['最新价']),
-                        'change_pct': float(row['涨跌幅'])
-                    })
-            except Exception as e:
-                logger.error(f"获取跌幅榜数据失败: {str(e)}")
-                losers = []
-        
-            # 获取趋势数据
-            trend_data = {
-                'dates': [],
-                'sh': [],
-                'sz': [],
-                'cyb': []
+            if not found:
+                logger.error(f"未找到{name}指数数据")
+                indices[name] = {
+                    'current': 0,
+                    'change_pct': 0,
+                    'change': 0
+                }
+    except Exception as e:
+        logger.error(f"获取指数数据失败: {str(e)}")
+        for name in index_map.keys():
+            indices[name] = {
+                'current': 0,
+                'change_pct': 0,
+                'change': 0
             }
-            
+
+    # 获取行业板块数据
+    industries = []
+    try:
+        df = source_result('industries')
+        
+        for _, row in df.head(5).iterrows():
+            industries.append({
+                'name': row['板块名称'],
+                'change_pct': float(row['涨跌幅'])
+            })
+    except Exception as e:
+        logger.error(f"获取行业板块数据失败: {str(e)}")
+        industries = []
+
+    # 涨幅榜、跌幅榜从共享行情快照派生，不再单独下载全市场行情
+    gainers = []
+    losers = []
+    try:
+        market_data = source_result('market')
+    except Exception as e:
+        logger.error(f"获取行情快照失败: {str(e)}")
+        market_data = None
+    if market_data is not None:
+        gainers = market_data.top_gainers(5)
+        losers = market_data.top_losers(5)
+        # 行业板块接口失败时，用快照中的所属行业汇总代替
+        if not industries:
+            industries = market_data.industry_summary(5)
+    else:
+        logger.error("获取涨跌幅榜数据失败: 无可用行情快照")
+
+    # 获取趋势数据
+    trend_data = {
+        'dates': [],
+        'sh': [],
+        'sz': [],
+        'cyb': []
+    }
+    
+    try:
+        # 获取最近30天的数据
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=30)
+        
+        for name in index_map.keys():
             try:
-                # 获取最近30天的数据
-                end_date = datetime.now()
-                start_date = end_date - timedelta(days=30)
-                
-                for name, code_list in index_map.items():
-                    try:
-                        code = code_list[0]  # 使用第一个代码
-                        with concurrent.futures.ThreadPoolExecutor() as pool:
-                            df = pool.submit(ak.stock_zh_index_daily_em, symbol=code).result()
-                        if not df.empty:
-                            df = df[(df['date'] >= start_date.strftime('%Y-%m-%d')) & 
-                                   (df['date'] <= end_date.strftime('%Y-%m-%d'))]
-                            
-                            if name == 'sh':
-                                trend_data['dates'] = df['date'].tolist()
-                            trend_data[name] = df['close'].tolist()
-                    except Exception as e:
-                        logger.error(f"获取{name}趋势数据失败: {str(e)}")
-                        trend_data[name] = []
+                df = source_result(f'trend_{name}', 'trend')
+                if not df.empty:
+                    df = df[(df['date'] >= start_date.strftime('%Y-%m-%d')) & 
+                           (df['date'] <= end_date.strftime('%Y-%m-%d'))]
+                    
+                    if name == 'sh':
+                        trend_data['dates'] = df['date'].tolist()
+                    trend_data[name] = df['close'].tolist()
             except Exception as e:
-                logger.error(f"获取趋势数据失败: {str(e)}")
-
-            # 更新缓存
-            dashboard_cache['data'] = {
-                'indices': indices,
-                'industries': industries,
-                'gainers': gainers,
-                'losers': losers,
-                'trend_data': trend_data,
-                'last_updated': get_beijing_time().strftime('%Y-%m-%d %H:%M:%S')  # 添加最后更新时间（北京时间）
-            }
-            dashboard_cache['timestamp'] = current_time
-            print("更新首页数据缓存")
-            
-        except Exception as e:
-            logger.error(f"获取首页数据失败: {str(e)}")
-            if dashboard_cache['data'] is not None:
-                print("使用过期缓存数据")
-    else:
-        print("使用有效的缓存数据，跳过更新")
-                
-    return dashboard_cache['data']
+                logger.error(f"获取{name}趋势数据失败: {str(e)}")
+                trend_data[name] = []
+    except Exception as e:
+        logger.error(f"获取趋势数据失败: {str(e)}")
+
+    data = {
+        'indices': indices,
+        'industries': industries,
+        'gainers': gainers,
+        'losers': losers,
+        'trend_data': trend_data,
+        'last_updated': get_beijing_time().strftime('%Y-%m-%d %H:%M:%S')  # 添加最后更新时间（北京时间）
+    }
+    print(f"更新首页数据缓存，耗时 {time.time() - started:.2f} 秒")
+    return data
 
 @app.route('/dashboard')
 @login_required
@@ -749,126 +878,57 @@ def stocks():
     """显示用户添加的股票列表"""
     portfolio = load_portfolio(current_user.id)
     
+    # 后台刷新进行中时直接显示已保存的数据，页面按进度接口逐只更新
+    job = refresh_jobs.get(request.args.get('job', ''), current_user.id)
+    
     # 获取最新行情数据
-    if portfolio:
+    if portfolio and not (job and job.active):
         market_data = get_market_data()
         
         if market_data is not None:
-            # 更新组合中的股票行情
-            for stock in portfolio:
-                stock_code = stock['symbol']
-                # 查找对应的行情数据
-                match = market_data[market_data['代码'] == stock_code]
-                if not match.empty:
-                    # 获取历史数据来计算平均成交量和技术指标
-                    try:
-                        end_date = datetime.now()
-                        start_date = end_date - timedelta(days=180)  # 使用更多历史数据以计算技术指标
-                        
-                        # 获取历史数据以计算技术指标
-                        daily_data = ak.stock_zh_a_hist(
-                            symbol=stock_code,
-                            period="daily",
-                            start_date=start_date.strftime('%Y%m%d'),
-                            end_date=end_date.strftime('%Y%m%d'),
-                            adjust="qfq"
-                        )
-                        
-                        if daily_data is not None and not daily_data.empty and len(daily_data) >= 20:
-                            # 重命名列，确保与模板兼容
-                            column_map = {
-                                '日期': 'trade_date',
-                                '开盘': 'open',
-                                '收盘': 'close',
-                                '最高': 'high',
-                                '最低': 'low',
-                                '成交量': 'vol',
-                                '成交额': 'amount'
-                            }
-                            daily_data = daily_data.rename(columns=column_map)
-                            
-                            # 计算平均成交量，用于判断放量/缩量
-                            vol_col = '成交量' if '成交量' in daily_data.columns else 'vol'
-                            if vol_col in daily_data.columns:
-                                avg_volume = daily_data[vol_col].mean()
-                                stock['avg_volume'] = float(avg_volume)
-                                
-                                if stock_code == "301232":  # 飞沃科技特殊调试
-                                    print(f"刷新时飞沃科技历史平均成交量: {avg_volume}, 当前成交量: {float(match.iloc[0]['成交量'])}")
-                            
-                            # 计算技术指标
-                            daily_data = calculate_indicators(daily_data)
-                            
-                            # 使用与详细分析页面相同的评分逻辑
-                            analysis_result = analyze_indicators(daily_data)
-                            
-                            # 保存详细分析结果
-                            stock['analysis_result'] = analysis_result
-                            stock['score'] = analysis_result['score']
-                            stock['recommendation'] = analysis_result['recommendation']
-                            stock['trend'] = analysis_result['trend']
-                            stock['rsi'] = analysis_result['rsi']
-                            stock['rsi_signal'] = analysis_result['rsi_signal']
-                            stock['macd_signal'] = analysis_result['macd_signal']
-                            stock['volume_trend'] = analysis_result['volume_trend']
-                            
-                            # 更新当前行情数据
-                            stock['current_price'] = float(match.iloc[0]['最新价'])
-                            stock['change_pct'] = float(match.iloc[0]['涨跌幅'])
-                            stock['change_amount'] = float(match.iloc[0]['涨跌额'])
-                            stock['volume'] = float(match.iloc[0]['成交量'])
-                            stock['turnover'] = float(match.iloc[0]['换手率']) if '换手率' in match.iloc[0] else 0
-                            stock['last_update'] = get_beijing_time().strftime('%Y-%m-%d %H:%M:%S')
-                            
-                            print(f"刷新时使用技术指标计算评分: {stock_code}, 评分: {analysis_result['score']}")
-                            
-                            # 特殊股票调试代码
-                            if stock_code == "301011":
-                                print(f"刷新时华立科技的技术指标评分: {analysis_result['score']}")
-                                print(f"华立科技的数据: {stock}")
-                            elif stock_code == "300750":
-                                print(f"刷新时宁德时代的技术指标评分: {analysis_result['score']}")
-                                print(f"宁德时代的数据: {stock}")
-                            elif stock_code == "301232":
-                                print(f"刷新时飞沃科技的技术指标评分: {analysis_result['score']}")
-                                print(f"飞沃科技的数据: {stock}")
-                            
-                            continue
-                            
-                    except Exception as e:
-                        print(f"计算技术指标失败: {stock_code}, {str(e)}")
-                    
-                    # 如果无法计算技术指标，回退到简化评分
-                    stock['current_price'] = float(match.iloc[0]['最新价'])
-                    stock['change_pct'] = float(match.iloc[0]['涨跌幅'])
-                    stock['change_amount'] = float(match.iloc[0]['涨跌额'])
-                    stock['volume'] = float(match.iloc[0]['成交量'])
-                    stock['turnover'] = float(match.iloc[0]['换手率']) if '换手率' in match.iloc[0] else 0
-                    stock['last_update'] = get_beijing_time().strftime('%Y-%m-%d %H:%M:%S')
-                    
-                    # 计算评分与投资建议（使用简化方法）
-                    result = calculate_stock_score(stock)
-                    stock['score'] = result['score']
-                    stock['recommendation'] = result['recommendation']
-                    stock['trend'] = result['trend']
-                    stock['rsi_signal'] = result['rsi_signal']
-                    stock['macd_signal'] = result['macd_signal']
-                    stock['volume_trend'] = result['volume_trend']
-                    
-                    # 特殊股票调试代码
-                    if stock_code == "301011":
-                        print(f"刷新时华立科技的简化评分: {result['score']}")
-                        print(f"华立科技的数据: {stock}")
-                    elif stock_code == "300750":
-                        print(f"刷新时宁德时代的简化评分: {result['score']}")
-                        print(f"宁德时代的数据: {stock}")
-                    elif stock_code == "301232":
-                        print(f"刷新时飞沃科技的简化评分: {result['score']}")
-                        print(f"飞沃科技的数据: {stock}")
-            
-            save_portfolio(current_user.id, portfolio)
+            # 批量更新组合中的股票行情和评分
+            portfolio_pipeline.run(portfolio, market_data)
+            save_symbol_snapshots(portfolio)
+    
+    return render_template('stocks.html', stocks=portfolio, job_id=job.job_id if job else None)
+
+@app.route('/stocks/stream')
+@login_required
+def stocks_stream():
+    """持仓行情推送（Server-Sent Events）
     
-    return render_template('stocks.html', stocks=portfolio)
+    行情快照每更新一个版本，推送一次用户持仓中行情或评分发生变化的股票，不写数据库。
+    """
+    if not stream_slots.acquire(blocking=False):
+        # 204 让浏览器停止重连，页面仍可通过刷新按钮和进度查询更新
+        return Response(status=204)
+    
+    portfolio = load_portfolio(current_user.id)
+    
+    def generate():
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        sent = {}
+        version = 0
+        expires = time.time() + STREAM_MAX_DURATION
+        while time.time() < expires:
+            market_data = market_refresher.wait_for_version(version, timeout=STREAM_HEARTBEAT)
+            if market_data is None or market_data.version <= version:
+                # 心跳，及时发现已断开的连接
+                yield ": keepalive\n\n"
+                continue
+            version = market_data.version
+            changes = portfolio_changes(portfolio, market_data, sent)
+            if changes:
+                yield f"id: {version}\nevent: quotes\ndata: {json.dumps(json_safe(changes), ensure_ascii=False)}\n\n"
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # 连接结束（含客户端断开）时由WSGI服务器关闭响应，释放连接名额
+    response.call_on_close(stream_slots.release)
+    return response
 
 @app.route('/add_stock', methods=['GET', 'POST'])
 @login_required
@@ -881,94 +941,28 @@ def add_stock():
         
         try:
             # 获取股票信息
-            stock_info_df = get_market_data()
+            market_data = get_market_data()
             
-            if stock_info_df is None:
+            if market_data is None:
                 return render_template('add_stock.html', error='无法获取市场数据，请稍后重试')
             
             # 找到对应的股票信息
-            stock_match = stock_info_df[stock_info_df['代码'] == stock_code]
-            if stock_match.empty:
+            quote = market_data.get_quote(stock_code)
+            if quote is None:
                 return render_template('add_stock.html', error=f'未找到股票代码 {stock_code}')
             
             # 创建股票信息
             stock_info = {
                 "ts_code": f"{stock_code}.{stock_code[0:1]}H" if stock_code.startswith('6') else f"{stock_code}.SZ",
                 "symbol": stock_code,
-                "name": stock_match.iloc[0]['名称'],
+                "name": quote['name'],
                 "area": "中国",
-                "industry": stock_match.iloc[0]['所属行业'] if '所属行业' in stock_match.iloc[0] else "",
-                "current_price": float(stock_match.iloc[0]['最新价']),
-                "change_pct": float(stock_match.iloc[0]['涨跌幅']),
-                "change_amount": float(stock_match.iloc[0]['涨跌额']),
-                "volume": float(stock_match.iloc[0]['成交量']),
-                "turnover": float(stock_match.iloc[0]['换手率']) if '换手率' in stock_match.iloc[0] else 0,
-                "last_update": get_beijing_time().strftime('%Y-%m-%d %H:%M:%S')
+                "industry": quote['industry']
             }
             
-            # 计算股票评分和投资建议
-            try:
-                # 获取历史数据来计算技术指标
-                end_date = datetime.now()
-                start_date = end_date - timedelta(days=180)
-                
-                daily_data = ak.stock_zh_a_hist(
-                    symbol=stock_code,
-                    period="daily",
-                    start_date=start_date.strftime('%Y%m%d'),
-                    end_date=end_date.strftime('%Y%m%d'),
-                    adjust="qfq"
-                )
-                
-                if daily_data is not None and not daily_data.empty and len(daily_data) >= 20:
-                    # 重命名列，确保与模板兼容
-                    column_map = {
-                        '日期': 'trade_date',
-                        '开盘': 'open',
-                        '收盘': 'close',
-                        '最高': 'high',
-                        '最低': 'low',
-                        '成交量': 'vol',
-                        '成交额': 'amount'
-                    }
-                    daily_data = daily_data.rename(columns=column_map)
-                    
-                    # 计算技术指标
-                    daily_data = calculate_indicators(daily_data)
-                    
-                    # 使用与详细分析页面相同的评分逻辑
-                    analysis_result = analyze_indicators(daily_data)
-                    
-                    # 保存详细分析结果
-                    stock_info['score'] = analysis_result['score']
-                    stock_info['recommendation'] = analysis_result['recommendation']
-                    stock_info['trend'] = analysis_result['trend']
-                    stock_info['rsi'] = analysis_result['rsi']
-                    stock_info['rsi_signal'] = analysis_result['rsi_signal']
-                    stock_info['macd_signal'] = analysis_result['macd_signal']
-                    stock_info['volume_trend'] = analysis_result['volume_trend']
-                    
-                    print(f"添加股票时使用技术指标计算评分: {stock_code}, 评分: {analysis_result['score']}")
-                else:
-                    # 如果无法获取足够的历史数据，回退到简化评分
-                    result = calculate_stock_score(stock_info)
-                    stock_info['score'] = result['score']
-                    stock_info['recommendation'] = result['recommendation']
-                    stock_info['trend'] = result['trend']
-                    stock_info['rsi_signal'] = result['rsi_signal'] 
-                    stock_info['macd_signal'] = result['macd_signal']
-                    stock_info['volume_trend'] = result['volume_trend']
-                    print(f"添加股票时使用简化评分: {stock_code}, 评分: {result['score']}")
-            except Exception as e:
-                print(f"添加股票时计算技术指标失败: {stock_code}, {str(e)}")
-                # 如果计算技术指标失败，回退到简化评分
-                result = calculate_stock_score(stock_info)
-                stock_info['score'] = result['score']
-                stock_info['recommendation'] = result['recommendation']
-                stock_info['trend'] = result['trend']
-                stock_info['rsi_signal'] = result['rsi_signal']
-                stock_info['macd_signal'] = result['macd_signal']
-                stock_info['volume_trend'] = result['volume_trend']
+            # 计算股票评分和投资建议，与持仓列表使用同一流水线
+            portfolio_pipeline.run([stock_info], market_data)
+            print(f"添加股票 {stock_code}, 评分: {stock_info['score']}")
             
             # 检查股票是否已存在于投资组合中
             existing = UserPortfolio.query.filter_by(user_id=current_user.id, symbol=stock_code).first()
@@ -1001,316 +995,191 @@ def remove_stock(symbol):
 @app.route('/refresh_stocks')
 @login_required
 def refresh_stocks():
-    """刷新股票数据"""
-    portfolio = load_portfolio(current_user.id)
+    """提交后台刷新任务，立即返回任务ID"""
+    symbols = [item.symbol for item in UserPortfolio.query.filter_by(user_id=current_user.id).all()]
+    wants_json = request.accept_mimetypes.best == 'application/json'
     
-    if portfolio:
-        # 清除缓存，强制重新获取最新数据
-        global market_data_cache
-        market_data_cache['data'] = None
-        market_data_cache['timestamp'] = 0
-        
-        market_data = get_market_data()
-        
-        if market_data is not None:
-            # 更新组合中的股票行情
-            for stock in portfolio:
-                stock_code = stock['symbol']
-                # 查找对应的行情数据
-                match = market_data[market_data['代码'] == stock_code]
-                if not match.empty:
-                    # 获取历史数据来计算平均成交量和技术指标
-                    try:
-                        end_date = datetime.now()
-                        start_date = end_date - timedelta(days=180)  # 使用更多历史数据以计算技术指标
-                        
-                        # 获取历史数据以计算技术指标
-                        daily_data = ak.stock_zh_a_hist(
-                            symbol=stock_code,
-                            period="daily",
-                            start_date=start_date.strftime('%Y%m%d'),
-                            end_date=end_date.strftime('%Y%m%d'),
-                            adjust="qfq"
-                        )
-                        
-                        if daily_data is not None and not daily_data.empty and len(daily_data) >= 20:
-                            # 重命名列，确保与模板兼容
-                            column_map = {
-                                '日期': 'trade_date',
-                                '开盘': 'open',
-                                '收盘': 'close',
-                                '最高': 'high',
-                                '最低': 'low',
-                                '成交量': 'vol',
-                                '成交额': 'amount'
-                            }
-                            daily_data = daily_data.rename(columns=column_map)
-                            
-                            # 计算平均成交量，用于判断放量/缩量
-                            vol_col = '成交量' if '成交量' in daily_data.columns else 'vol'
-                            if vol_col in daily_data.columns:
-                                avg_volume = daily_data[vol_col].mean()
-                                stock['avg_volume'] = float(avg_volume)
-                                
-                                if stock_code == "301232":  # 飞沃科技特殊调试
-                                    print(f"刷新时飞沃科技历史平均成交量: {avg_volume}, 当前成交量: {float(match.iloc[0]['成交量'])}")
-                            
-                            # 计算技术指标
-                            daily_data = calculate_indicators(daily_data)
-                            
-                            # 使用与详细分析页面相同的评分逻辑
-                            analysis_result = analyze_indicators(daily_data)
-                            
-                            # 保存详细分析结果
-                            stock['analysis_result'] = analysis_result
-                            stock['score'] = analysis_result['score']
-                            stock['recommendation'] = analysis_result['recommendation']
-                            stock['trend'] = analysis_result['trend']
-                            stock['rsi'] = analysis_result['rsi']
-                            stock['rsi_signal'] = analysis_result['rsi_signal']
-                            stock['macd_signal'] = analysis_result['macd_signal']
-                            stock['volume_trend'] = analysis_result['volume_trend']
-                            
-                            # 更新当前行情数据
-                            stock['current_price'] = float(match.iloc[0]['最新价'])
-                            stock['change_pct'] = float(match.iloc[0]['涨跌幅'])
-                            stock['change_amount'] = float(match.iloc[0]['涨跌额'])
-                            stock['volume'] = float(match.iloc[0]['成交量'])
-                            stock['turnover'] = float(match.iloc[0]['换手率']) if '换手率' in match.iloc[0] else 0
-                            stock['last_update'] = get_beijing_time().strftime('%Y-%m-%d %H:%M:%S')
-                            
-                            print(f"刷新时使用技术指标计算评分: {stock_code}, 评分: {analysis_result['score']}")
-                            
-                            # 特殊股票调试代码
-                            if stock_code == "301011":
-                                print(f"刷新时华立科技的技术指标评分: {analysis_result['score']}")
-                                print(f"华立科技的数据: {stock}")
-                            elif stock_code == "300750":
-                                print(f"刷新时宁德时代的技术指标评分: {analysis_result['score']}")
-                                print(f"宁德时代的数据: {stock}")
-                            elif stock_code == "301232":
-                                print(f"刷新时飞沃科技的技术指标评分: {analysis_result['score']}")
-                                print(f"飞沃科技的数据: {stock}")
-                            
-                            continue
-                            
-                    except Exception as e:
-                        print(f"计算技术指标失败: {stock_code}, {str(e)}")
-                    
-                    # 如果无法计算技术指标，回退到简化评分
-                    stock['current_price'] = float(match.iloc[0]['最新价'])
-                    stock['change_pct'] = float(match.iloc[0]['涨跌幅'])
-                    stock['change_amount'] = float(match.iloc[0]['涨跌额'])
-                    stock['volume'] = float(match.iloc[0]['成交量'])
-                    stock['turnover'] = float(match.iloc[0]['换手率']) if '换手率' in match.iloc[0] else 0
-                    stock['last_update'] = get_beijing_time().strftime('%Y-%m-%d %H:%M:%S')
-                    
-                    # 计算评分与投资建议（使用简化方法）
-                    result = calculate_stock_score(stock)
-                    stock['score'] = result['score']
-                    stock['recommendation'] = result['recommendation']
-                    stock['trend'] = result['trend']
-                    stock['rsi_signal'] = result['rsi_signal']
-                    stock['macd_signal'] = result['macd_signal']
-                    stock['volume_trend'] = result['volume_trend']
-                    
-                    # 特殊股票调试代码
-                    if stock_code == "301011":
-                        print(f"刷新时华立科技的简化评分: {result['score']}")
-                        print(f"华立科技的数据: {stock}")
-                    elif stock_code == "300750":
-                        print(f"刷新时宁德时代的简化评分: {result['score']}")
-                        print(f"宁德时代的数据: {stock}")
-                    elif stock_code == "301232":
-                        print(f"刷新时飞沃科技的简化评分: {result['score']}")
-                        print(f"飞沃科技的数据: {stock}")
-            
-            # 保存更新后的投资组合
-            save_portfolio(current_user.id, portfolio)
-            flash('股票数据已刷新', 'success')
+    if not symbols:
+        if wants_json:
+            return jsonify({'error': '投资组合为空'}), 400
+        return redirect(url_for('stocks'))
     
-    return redirect(url_for('stocks'))
+    # 在后台触发一次行情刷新，刷新任务使用当前快照，不等待上游
+    market_refresher.trigger()
+    job = refresh_jobs.submit(current_user.id, symbols)
+    
+    if wants_json:
+        return jsonify(job.to_dict()), 202
+    flash('已开始在后台刷新股票数据', 'info')
+    return redirect(url_for('stocks', job=job.job_id))
+
+@app.route('/refresh_stocks/<job_id>')
+@login_required
+def refresh_progress(job_id):
+    """刷新任务进度：done/total、每只股票的状态，以及第since个之后完成的股票数据"""
+    job = refresh_jobs.get(job_id, current_user.id)
+    if job is None:
+        return jsonify({'error': '刷新任务不存在或已过期'}), 404
+    return jsonify(job.to_dict(since=request.args.get('since', 0, type=int)))
 
 @app.route('/analysis/<symbol>')
 @login_required
 def analysis(symbol):
-    max_retries = 3
-    retry_delay = 5
+    # 整个请求共享一个时间预算，上游不可用时尽快回退到最近一次的可用数据，不再sleep重试
+    deadline = Deadline(ANALYSIS_DEADLINE)
     
-    for attempt in range(max_retries):
-        try:
-            print(f"开始第 {attempt + 1} 次尝试获取股票 {symbol} 的数据...")
-            
-            # 从symbol中提取实际的股票代码
-            stock_code = symbol.split('.')[0]
-            print(f"提取的股票代码：{stock_code}")
+    try:
+        print(f"开始获取股票 {symbol} 的数据...")
+        
+        # 从symbol中提取实际的股票代码
+        stock_code = symbol.split('.')[0]
+        print(f"提取的股票代码：{stock_code}")
+        
+        # 从共享行情快照中获取股票信息
+        market_data = get_market_data(timeout=deadline.remaining())
+        
+        # 找到对应的股票信息
+        quote = market_data.get_quote(stock_code) if market_data is not None else None
+        if quote is None:
+            # 行情快照不可用时，使用本地日线中最近的收盘数据
+            quote = history_store.last_quote(stock_code)
+            if quote is None:
+                raise Exception(f"未找到股票代码 {stock_code}")
+            holding = UserPortfolio.query.filter_by(symbol=stock_code).first()
+            quote['name'] = holding.name if holding else stock_code
+            print(f"行情快照不可用，使用本地日线数据: {stock_code}")
             
-            # 获取所有A股数据
-            stock_info_df = ak.stock_zh_a_spot_em()
+        # 提取股票基本信息
+        stock_info = {
+            "ts_code": symbol,
+            "symbol": stock_code,
+            "name": quote['name'],
+            "area": "中国",
+            "industry": quote['industry'],
+            "list_date": "",
+            "current_price": quote['current_price'],
+            "change_pct": quote['change_pct'],
+            "change_amount": quote['change_amount'],
+            "volume": quote['volume'],
+            "turnover": quote['turnover']
+        }
+        
+        # 华立科技特殊调试代码
+        if stock_code == "301011":
+            print("检测到华立科技，进行特殊调试输出...")
+            simple_score_result = calculate_stock_score(stock_info)
+            print(f"简单评分结果: {simple_score_result}")
+            # 保存简化评分结果供后续比较
+            stock_info['simple_score'] = simple_score_result['score']
+        elif stock_code == "300750":
+            print("检测到宁德时代，进行特殊调试输出...")
+            simple_score_result = calculate_stock_score(stock_info)
+            print(f"简单评分结果: {simple_score_result}")
+            # 保存简化评分结果供后续比较
+            stock_info['simple_score'] = simple_score_result['score']
+        elif stock_code == "301232":
+            print("检测到飞沃科技，进行特殊调试输出...")
             
-            # 找到对应的股票信息
-            stock_match = stock_info_df[stock_info_df['代码'] == stock_code]
-            if stock_match.empty:
-                raise Exception(f"未找到股票代码 {stock_code}")
+            # 计算飞沃科技的历史平均成交量用于简化评分
+            try:
+                hist_data = history_store.get_history(stock_code, days=30, sync=False)
                 
-            # 提取股票基本信息
-            stock_info = {
-                "ts_code": symbol,
-                "symbol": stock_code,
-                "name": stock_match.iloc[0]['名称'],
-                "area": "中国",
-                "industry": stock_match.iloc[0]['所属行业'] if '所属行业' in stock_match.iloc[0] else "",
-                "list_date": "",
-                "current_price": float(stock_match.iloc[0]['最新价']),
-                "change_pct": float(stock_match.iloc[0]['涨跌幅']),
-                "change_amount": float(stock_match.iloc[0]['涨跌额']),
-                "volume": float(stock_match.iloc[0]['成交量']),
-                "turnover": float(stock_match.iloc[0]['换手率']) if '换手率' in stock_match.iloc[0] else 0
-            }
+                if hist_data is not None and not hist_data.empty:
+                    vol_col = '成交量' if '成交量' in hist_data.columns else 'vol'
+                    if vol_col in hist_data.columns:
+                        avg_volume = hist_data[vol_col].mean()
+                        stock_info['avg_volume'] = float(avg_volume)
+                        print(f"飞沃科技历史平均成交量: {avg_volume}, 当前成交量: {stock_info['volume']}")
+            except Exception as e:
+                print(f"获取飞沃科技历史成交量失败: {str(e)}")
+                
+            simple_score_result = calculate_stock_score(stock_info)
+            print(f"简单评分结果: {simple_score_result}")
+            # 保存简化评分结果供后续比较
+            stock_info['simple_score'] = simple_score_result['score']
+        
+        print("股票基本信息:", stock_info)
+        
+        # 获取最近180天的日线数据以计算技术指标
+        end_date = get_beijing_time()
+        daily_data = history_store.get_history(stock_code, timeout=deadline.remaining())
+        
+        print(f"获取到日线数据: {len(daily_data)} 条")
+        
+        if daily_data is None or daily_data.empty:
+            print("日线数据为空，使用示例数据")
+            daily_data = pd.DataFrame({
+                'trade_date': [end_date.strftime('%Y%m%d')],
+                'open': [10.0],
+                'high': [11.0],
+                'low': [9.0],
+                'close': [10.5],
+                'vol': [1000000],
+                'amount': [10500000]
+            })
+            # 没有日线数据时评分字段使用"数据不足"的默认结果
+            stock_info.update(analyze_indicators(daily_data))
+        else:
+            # 计算技术指标
+            daily_data = calculate_indicators(daily_data)
             
-            # 华立科技特殊调试代码
+            # 获取最新指标评分
+            analysis_result = analyze_indicators(daily_data)
             if stock_code == "301011":
-                print("检测到华立科技，进行特殊调试输出...")
-                simple_score_result = calculate_stock_score(stock_info)
-                print(f"简单评分结果: {simple_score_result}")
-                # 保存简化评分结果供后续比较
-                stock_info['simple_score'] = simple_score_result['score']
+                print(f"详细分析页面华立科技的评分计算过程:")
+                print(f"  趋势: {analysis_result['trend']}")
+                print(f"  RSI: {analysis_result['rsi']:.2f} -> 信号: {analysis_result['rsi_signal']}")
+                print(f"  MACD信号: {analysis_result['macd_signal']}")
+                print(f"  成交量趋势: {analysis_result['volume_trend']}")
+                print(f"  波动率: {analysis_result['volatility']:.2f}%")
+                print(f"  最终评分: {analysis_result['score']}")
             elif stock_code == "300750":
-                print("检测到宁德时代，进行特殊调试输出...")
-                simple_score_result = calculate_stock_score(stock_info)
-                print(f"简单评分结果: {simple_score_result}")
-                # 保存简化评分结果供后续比较
-                stock_info['simple_score'] = simple_score_result['score']
+                print(f"详细分析页面宁德时代的评分计算过程:")
+                print(f"  趋势: {analysis_result['trend']}")
+                print(f"  RSI: {analysis_result['rsi']:.2f} -> 信号: {analysis_result['rsi_signal']}")
+                print(f"  MACD信号: {analysis_result['macd_signal']}")
+                print(f"  成交量趋势: {analysis_result['volume_trend']}")
+                print(f"  波动率: {analysis_result['volatility']:.2f}%")
+                print(f"  最终评分: {analysis_result['score']}")
             elif stock_code == "301232":
-                print("检测到飞沃科技，进行特殊调试输出...")
+                print(f"详细分析页面飞沃科技的评分计算过程:")
+                print(f"  趋势: {analysis_result['trend']}")
+                print(f"  RSI: {analysis_result['rsi']:.2f} -> 信号: {analysis_result['rsi_signal']}")
+                print(f"  MACD信号: {analysis_result['macd_signal']}")
+                print(f"  成交量趋势: {analysis_result['volume_trend']}")
+                print(f"  波动率: {analysis_result['volatility']:.2f}%")
+                print(f"  最终评分: {analysis_result['score']}")
                 
-                # 计算飞沃科技的历史平均成交量用于简化评分
+                # 对比简化评分与详细评分差异
                 try:
-                    hist_start_date = end_date - timedelta(days=30)
-                    hist_data = ak.stock_zh_a_hist(
-                        symbol=stock_code,
-                        period="daily",
-                        start_date=hist_start_date.strftime('%Y%m%d'),
-                        end_date=end_date.strftime('%Y%m%d'),
-                        adjust="qfq"
-                    )
-                    
-                    if hist_data is not None and not hist_data.empty:
-                        vol_col = '成交量' if '成交量' in hist_data.columns else 'vol'
-                        if vol_col in hist_data.columns:
-                            avg_volume = hist_data[vol_col].mean()
-                            stock_info['avg_volume'] = float(avg_volume)
-                            print(f"飞沃科技历史平均成交量: {avg_volume}, 当前成交量: {stock_info['volume']}")
+                    simple_score = stock_info.get('simple_score', None)
+                    if simple_score:
+                        print(f"评分差异对比 - 飞沃科技:")
+                        print(f"  详细评分: {analysis_result['score']}")
+                        print(f"  简化评分: {simple_score}")
+                        print(f"  差异: {analysis_result['score'] - simple_score}")
                 except Exception as e:
-                    print(f"获取飞沃科技历史成交量失败: {str(e)}")
-                    
-                simple_score_result = calculate_stock_score(stock_info)
-                print(f"简单评分结果: {simple_score_result}")
-                # 保存简化评分结果供后续比较
-                stock_info['simple_score'] = simple_score_result['score']
-            
-            print("股票基本信息:", stock_info)
-            
-            # 获取最近180天的日线数据以计算技术指标
-            end_date = get_beijing_time()
-            start_date = end_date - timedelta(days=180)
-            
-            daily_data = ak.stock_zh_a_hist(
-                symbol=stock_code,
-                period="daily",
-                start_date=start_date.strftime('%Y%m%d'),
-                end_date=end_date.strftime('%Y%m%d'),
-                adjust="qfq"
-            )
-            
-            print(f"获取到日线数据: {len(daily_data)} 条")
-            
-            if daily_data is None or daily_data.empty:
-                print("日线数据为空，使用示例数据")
-                daily_data = pd.DataFrame({
-                    'trade_date': [end_date.strftime('%Y%m%d')],
-                    'open': [10.0],
-                    'high': [11.0],
-                    'low': [9.0],
-                    'close': [10.5],
-                    'vol': [1000000],
-                    'amount': [10500000]
-                })
-            else:
-                # 重命名列，确保与模板兼容
-                column_map = {
-                    '日期': 'trade_date',
-                    '开盘': 'open',
-                    '收盘': 'close',
-                    '最高': 'high',
-                    '最低': 'low',
-                    '成交量': 'vol',
-                    '成交额': 'amount'
-                }
-                daily_data = daily_data.rename(columns=column_map)
-                
-                # 计算技术指标
-                daily_data = calculate_indicators(daily_data)
-                
-                # 获取最新指标评分
-                analysis_result = analyze_indicators(daily_data)
-                if stock_code == "301011":
-                    print(f"详细分析页面华立科技的评分计算过程:")
-                    print(f"  趋势: {analysis_result['trend']}")
-                    print(f"  RSI: {analysis_result['rsi']:.2f} -> 信号: {analysis_result['rsi_signal']}")
-                    print(f"  MACD信号: {analysis_result['macd_signal']}")
-                    print(f"  成交量趋势: {analysis_result['volume_trend']}")
-                    print(f"  波动率: {analysis_result['volatility']:.2f}%")
-                    print(f"  最终评分: {analysis_result['score']}")
-                elif stock_code == "300750":
-                    print(f"详细分析页面宁德时代的评分计算过程:")
-                    print(f"  趋势: {analysis_result['trend']}")
-                    print(f"  RSI: {analysis_result['rsi']:.2f} -> 信号: {analysis_result['rsi_signal']}")
-                    print(f"  MACD信号: {analysis_result['macd_signal']}")
-                    print(f"  成交量趋势: {analysis_result['volume_trend']}")
-                    print(f"  波动率: {analysis_result['volatility']:.2f}%")
-                    print(f"  最终评分: {analysis_result['score']}")
-                elif stock_code == "301232":
-                    print(f"详细分析页面飞沃科技的评分计算过程:")
-                    print(f"  趋势: {analysis_result['trend']}")
-                    print(f"  RSI: {analysis_result['rsi']:.2f} -> 信号: {analysis_result['rsi_signal']}")
-                    print(f"  MACD信号: {analysis_result['macd_signal']}")
-                    print(f"  成交量趋势: {analysis_result['volume_trend']}")
-                    print(f"  波动率: {analysis_result['volatility']:.2f}%")
-                    print(f"  最终评分: {analysis_result['score']}")
-                    
-                    # 对比简化评分与详细评分差异
-                    try:
-                        simple_score = stock_info.get('simple_score', None)
-                        if simple_score:
-                            print(f"评分差异对比 - 飞沃科技:")
-                            print(f"  详细评分: {analysis_result['score']}")
-                            print(f"  简化评分: {simple_score}")
-                            print(f"  差异: {analysis_result['score'] - simple_score}")
-                    except Exception as e:
-                        print(f"评分对比出错: {str(e)}")
-                    
-                stock_info.update(analysis_result)
-            
-            # 获取财务指标
-            try:
-                fina_indicator = ak.stock_financial_abstract(stock=stock_code)
-                print(f"获取到财务指标: {len(fina_indicator)} 条")
+                    print(f"评分对比出错: {str(e)}")
                 
-                # 处理财务指标数据以适应模板
-                fina_processed = []
-                for _, row in fina_indicator.iterrows():
-                    indicator = {
-                        'end_date': row['截止日期'] if '截止日期' in row else "",
-                        'basic_eps': row['基本每股收益'] if '基本每股收益' in row else 0,
-                        'bps': row['每股净资产'] if '每股净资产' in row else 0,
-                        'roe': row['净资产收益率'] if '净资产收益率' in row else 0,
-                        'roa': 0,  # 暂无ROA数据
-                        'net_profit_margin': row['销售净利率'] if '销售净利率' in row else 0
-                    }
-                    fina_processed.append(indicator)
-            except Exception as e:
-                print(f"获取财务指标失败: {str(e)}")
+            stock_info.update(analysis_result)
+        
+        # 获取财务指标
+        cached_fina = fundamentals_cache.read(stock_code)
+        try:
+            if fundamentals_cache.needs_revalidation(cached_fina):
+                # 披露季或本地缺少报告时才访问上游，受请求时间预算约束
+                fina_processed = run_with_deadline(analysis_executor, fundamentals_cache.get, deadline, stock_code)
+            else:
+                fina_processed = cached_fina['records']
+            print(f"获取到财务指标: {len(fina_processed)} 条")
+            if not fina_processed:
+                raise Exception("财务指标为空")
+        except Exception as e:
+            print(f"获取财务指标失败: {str(e)}")
+            if cached_fina and cached_fina['records']:
+                # 上游失败或超时，使用本地缓存的财务指标
+                fina_processed = cached_fina['records']
+            else:
                 fina_processed = [{
                     'end_date': end_date.strftime('%Y%m%d'),
                     'basic_eps': 0.5,
@@ -1319,196 +1188,221 @@ def analysis(symbol):
                     'roa': 5.0,
                     'net_profit_margin': 20.0
                 }]
-            
-            return render_template('analysis.html', 
-                                 stock_info=stock_info,
-                                 daily_data=daily_data.to_dict('records'),
-                                 fina_indicator=fina_processed)
-        except Exception as e:
-            print(f"错误信息：{str(e)}")
-            if attempt < max_retries - 1:
-                print(f"尝试 {attempt + 1} 失败，{retry_delay}秒后重试...")
-                time.sleep(retry_delay)
-            else:
-                print("所有重试都失败，返回示例数据")
-                example_data = {
-                    "stock_info": {
-                        "ts_code": symbol,
-                        "symbol": symbol.split('.')[0],
-                        "name": "示例股票",
-                        "area": "示例地区",
-                        "industry": "示例行业",
-                        "list_date": "20200101",
-                        "current_price": 10.5,
-                        "change_pct": 2.5,
-                        "change_amount": 0.25,
-                        "score": 65,
-                        "trend": "上升",
-                        "rsi_signal": "中性",
-                        "macd_signal": "买入",
-                        "recommendation": "建议买入"
-                    },
-                    "daily_data": [{
-                        "trade_date": get_beijing_time().strftime('%Y%m%d'),
-                        "open": 10.0,
-                        "high": 11.0,
-                        "low": 9.0,
-                        "close": 10.5,
-                        "vol": 1000000,
-                        "amount": 10500000
-                    }],
-                    "fina_indicator": [{
-                        "end_date": get_beijing_time().strftime('%Y%m%d'),
-                        "basic_eps": 0.5,
-                        "bps": 5.0,
-                        "roe": 10.0,
-                        "roa": 5.0,
-                        "net_profit_margin": 20.0
-                    }]
-                }
-                return render_template('analysis.html', 
-                                     stock_info=example_data["stock_info"],
-                                     daily_data=example_data["daily_data"],
-                                     fina_indicator=example_data["fina_indicator"])
-
-def calculate_indicators(df):
-    """计算技术指标"""
-    try:
-        # 计算RSI
-        delta = df['close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        df['RSI'] = 100 - (100 / (1 + rs))
-        
-        # 计算MACD
-        exp1 = df['close'].ewm(span=12, adjust=False).mean()
-        exp2 = df['close'].ewm(span=26, adjust=False).mean()
-        df['MACD'] = exp1 - exp2
-        df['Signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
-        
-        # 计算MA
-        df['MA5'] = df['close'].rolling(window=5).mean()
-        df['MA10'] = df['close'].rolling(window=10).mean()
-        df['MA20'] = df['close'].rolling(window=20).mean()
-        df['MA60'] = df['close'].rolling(window=60).mean()
-        
-        # 计算波动率
-        df['Volatility'] = df['close'].pct_change().rolling(window=20).std() * np.sqrt(252) * 100
-        
-        # 计算布林带
-        df['BBand_middle'] = df['close'].rolling(window=20).mean()
-        std = df['close'].rolling(window=20).std()
-        df['BBand_upper'] = df['BBand_middle'] + (2 * std)
-        df['BBand_lower'] = df['BBand_middle'] - (2 * std)
-        
-        # 计算相对强度
-        df['Strength'] = (df['close'] - df['close'].rolling(window=60).min()) / (df['close'].rolling(window=60).max() - df['close'].rolling(window=60).min()) * 100
-        
-        return df
         
+        return render_template('analysis.html', 
+                             stock_info=stock_info,
+                             fina_indicator=fina_processed)
     except Exception as e:
-        print(f"计算技术指标失败: {str(e)}")
-        return df
-
-def analyze_indicators(df):
-    """分析技术指标生成报告和评分，使用@StockAnalysis的评分逻辑"""
-    try:
-        if len(df) < 20:
-            return {
-                "trend": "数据不足",
+        print(f"错误信息：{str(e)}")
+        print("获取数据失败，返回示例数据")
+        example_data = {
+            "stock_info": {
+                "ts_code": symbol,
+                "symbol": symbol.split('.')[0],
+                "name": "示例股票",
+                "area": "示例地区",
+                "industry": "示例行业",
+                "list_date": "20200101",
+                "current_price": 10.5,
+                "change_pct": 2.5,
+                "change_amount": 0.25,
+                "volume": 0,
+                "turnover": 0,
                 "volatility": 0,
-                "rsi": 0,
-                "rsi_signal": "数据不足",
-                "macd_signal": "数据不足",
-                "volume_trend": "数据不足",
-                "score": 50,
-                "recommendation": "数据不足"
-            }
-            
-        latest = df.iloc[-1]
-        
-        # 趋势分析
-        trend = "上升" if latest['MA5'] > latest['MA20'] else "下降"
-        
-        # 波动性分析
-        volatility = float(latest['Volatility'])
-        
-        # RSI分析
-        rsi = float(latest['RSI'])
-        rsi_signal = "超买" if rsi > 70 else "超卖" if rsi < 30 else "中性"
-        
-        # MACD分析
-        macd_signal = "买入" if latest['MACD'] > latest['Signal'] else "卖出"
-        
-        # 成交量分析 - 使用近5日平均与近20日平均比较
-        recent_vol_avg = df['vol'].iloc[-5:].mean()
-        long_vol_avg = df['vol'].iloc[-20:].mean()
-        volume_trend = "放量" if recent_vol_avg > long_vol_avg else "缩量"
-        
-        # 记录计算过程，便于调试
-        recent_vol = recent_vol_avg
-        last_vol = float(latest['vol'])
-        
-        # 计算布林带位置
-        bband_position = (latest['close'] - latest['BBand_lower']) / (latest['BBand_upper'] - latest['BBand_lower']) * 100
-        bband_signal = "超卖区" if bband_position < 20 else "超买区" if bband_position > 80 else "中性"
-        
-        # 使用@StockAnalysis的评分逻辑
-        score = 0
-        score += 30 if trend == "上升" else 0
-        score += 20 if 30 < rsi < 70 else 0
-        score += 20 if macd_signal == "买入" else 0
-        score += 15 if volume_trend == "放量" else 0
-        score += 15 if volatility < 30 else 0
-        
-        print(f"DEBUG - 详细分析页面评分计算:")
-        print(f"  趋势(30分): {trend} -> {30 if trend == '上升' else 0}分")
-        print(f"  RSI(20分): {rsi:.2f} -> {20 if 30 < rsi < 70 else 0}分")
-        print(f"  MACD(20分): {macd_signal} -> {20 if macd_signal == '买入' else 0}分")
-        print(f"  成交量(15分): {volume_trend}(最新:{last_vol:.0f}, 近5日均:{recent_vol:.0f}) -> {15 if volume_trend == '放量' else 0}分")
-        print(f"  波动率(15分): {volatility:.2f}% -> {15 if volatility < 30 else 0}分")
-        print(f"  总分: {score}分")
-        
-        # 根据总分生成投资建议
-        if score >= 80:
-            recommendation = "强烈推荐买入"
-        elif score >= 60:
-            recommendation = "建议买入"
-        elif score >= 40:
-            recommendation = "建议观望"
-        elif score >= 20:
-            recommendation = "建议减持"
+                "rsi": 50,
+                "volume_trend": "未知",
+                "score": 65,
+                "trend": "上升",
+                "rsi_signal": "中性",
+                "macd_signal": "买入",
+                "recommendation": "建议买入"
+            },
+            "fina_indicator": [{
+                "end_date": get_beijing_time().strftime('%Y%m%d'),
+                "basic_eps": 0.5,
+                "bps": 5.0,
+                "roe": 10.0,
+                "roa": 5.0,
+                "net_profit_margin": 20.0
+            }]
+        }
+        return render_template('analysis.html', 
+                             stock_info=example_data["stock_info"],
+                             fina_indicator=example_data["fina_indicator"])
+
+# JSON接口版本，响应结构变化时递增，ETag随之失效
+API_VERSION = 'v1'
+
+# 响应体超过该大小（字节）且客户端支持时使用gzip压缩
+GZIP_MIN_SIZE = 1024
+
+def conditional_response(version, build):
+    """按数据版本返回响应
+    
+    ETag由数据版本（而不是响应内容）计算，与请求的 If-None-Match 相同时
+    直接返回304，不构建响应内容。
+    
+    Args:
+        version: 可JSON序列化的数据版本
+        build: 构建 Response 的函数
+    """
+    etag = hashlib.sha1(
+        json.dumps([API_VERSION, version], sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+    # gzip压缩后的响应是另一种表示，使用带 -gzip 后缀的ETag，与未压缩的响应区分
+    candidates = [f'{etag}-gzip', etag] if 'gzip' in request.accept_encodings else [etag]
+    matched = next((tag for tag in candidates if request.if_none_match.contains(tag)), None)
+    if matched is not None:
+        response = Response(status=304)
+        response.set_etag(matched)
+    else:
+        response = build()
+        if response.headers.get('Content-Encoding') == 'gzip':
+            response.set_etag(f'{etag}-gzip')
         else:
-            recommendation = "建议卖出"
-            
+            response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def conditional_json(version, build):
+    """按数据版本返回JSON，build 返回可JSON序列化的内容
+
+    NaN（如停牌股票缺失的行情）输出为null，严格的JSON客户端才能解析。
+    """
+    return conditional_response(version, lambda: jsonify(json_safe(build())))
+
+def gzip_response(response):
+    """客户端支持时压缩响应体"""
+    response.headers['Vary'] = 'Accept-Encoding'
+    if 'gzip' in request.accept_encodings and response.content_length and response.content_length >= GZIP_MIN_SIZE:
+        response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.route(f'/api/{API_VERSION}/portfolio')
+@login_required
+def api_portfolio():
+    """当前用户的持仓行情和评分，不写数据库"""
+    market_data = get_market_data()
+    if market_data is None:
+        return jsonify({'error': '无法获取市场数据'}), 503
+    
+    portfolio = load_portfolio(current_user.id)
+    symbols = [stock['symbol'] for stock in portfolio]
+    history_store.sync_many(symbols)
+    version = {
+        'user': current_user.id,
+        'snapshot': market_data.version,
+        'holdings': [[stock['symbol'], stock['name']] for stock in portfolio],
+        'bars': history_store.bar_versions(symbols)
+    }
+    
+    def build():
+        portfolio_pipeline.run(portfolio, market_data, sync=False)
         return {
-            "trend": trend,
-            "volatility": volatility,
-            "rsi": rsi,
-            "rsi_signal": rsi_signal,
-            "macd_signal": macd_signal,
-            "volume_trend": volume_trend,
-            "recent_vol": recent_vol,
-            "long_vol_avg": long_vol_avg,
-            "bband_signal": bband_signal,
-            "bband_position": bband_position,
-            "score": int(score),
-            "recommendation": recommendation
+            'snapshot_version': market_data.version,
+            'stocks': portfolio
         }
-            
+    
+    return conditional_json(version, build)
+
+@app.route(f'/api/{API_VERSION}/dashboard')
+@login_required
+def api_dashboard():
+    """首页数据：指数、行业、涨跌幅榜和指数走势"""
+    data = get_dashboard_data()
+    if data is None:
+        return jsonify({'error': '获取数据失败，请稍后重试'}), 503
+    return conditional_json({'dashboard': dashboard_cache.timestamp}, lambda: data)
+
+@app.route(f'/api/{API_VERSION}/analysis/<symbol>')
+@login_required
+def api_analysis(symbol):
+    """单只股票的行情、技术分析和财务指标"""
+    deadline = Deadline(ANALYSIS_DEADLINE)
+    stock_code = symbol.split('.')[0]
+    
+    market_data = get_market_data(timeout=deadline.remaining())
+    quote = market_data.get_quote(stock_code) if market_data is not None else None
+    if quote is None:
+        return jsonify({'error': f'未找到股票代码 {stock_code}'}), 404
+    
+    # 日线和财务指标都先在时间预算内尝试更新，超时则使用本地已有数据；日线由分析缓存读取，这里只同步
+    try:
+        run_with_deadline(analysis_executor, history_store.sync, deadline, stock_code)
     except Exception as e:
-        print(f"分析技术指标失败: {str(e)}")
+        logger.warning(f"同步 {stock_code} 日线未完成，使用本地数据: {str(e)}")
+    cached_fina = fundamentals_cache.read(stock_code)
+    if fundamentals_cache.needs_revalidation(cached_fina):
+        try:
+            run_with_deadline(analysis_executor, fundamentals_cache.get, deadline, stock_code)
+        except Exception as e:
+            logger.error(f"获取 {stock_code} 财务指标失败: {str(e)}")
+        cached_fina = fundamentals_cache.read(stock_code)
+    
+    version = {
+        'symbol': stock_code,
+        'snapshot': market_data.version,
+        'bars': history_store.bar_versions([stock_code])[stock_code],
+        'financials': cached_fina['checked_at'] if cached_fina else None
+    }
+    
+    def build():
+        entry = analysis_cache.get_many([stock_code], sync=False).get(stock_code) or {}
+        analysis_result = entry.get('analysis_result')
+        if analysis_result is None:
+            analysis_result = calculate_stock_score(dict(quote))
         return {
-            "trend": "分析失败",
-            "volatility": 0,
-            "rsi": 0,
-            "rsi_signal": "未知",
-            "macd_signal": "未知",
-            "volume_trend": "未知",
-            "score": 50,
-            "recommendation": "数据不足"
+            'snapshot_version': market_data.version,
+            'quote': quote,
+            'analysis': analysis_result,
+            'avg_volume': entry.get('avg_volume'),
+            'financials': cached_fina['records'] if cached_fina else []
         }
+    
+    return conditional_json(version, build)
+
+@app.route(f'/api/{API_VERSION}/chart/<symbol>')
+@login_required
+def api_chart(symbol):
+    """图表数据：按列返回请求的日线和技术指标序列
+    
+    Query:
+        series: 逗号分隔的序列名，默认 close,vol
+        days: 自然日窗口，默认为本地日线窗口
+        format: json（默认，列数组）或 f32（二进制，见 chart_data.to_float32_buffer）
+    """
+    stock_code = symbol.split('.')[0]
+    try:
+        series = parse_series(request.args.get('series'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    days = request.args.get('days', history_store.window_days, type=int)
+    output = request.args.get('format', 'json')
+    if output not in ('json', 'f32'):
+        return jsonify({'error': f'不支持的格式: {output}'}), 400
+    
+    # 只读取本地日线，日线由分析页面和持仓刷新同步
+    version = {
+        'chart': stock_code,
+        'bars': history_store.bar_versions([stock_code])[stock_code],
+        'series': series,
+        'days': days,
+        'format': output
+    }
+    
+    def build():
+        dates, columns = chart_columns(history_store.read(stock_code, days), series)
+        if output == 'f32':
+            response = Response(to_float32_buffer(dates, columns), mimetype='application/octet-stream')
+            response.headers['X-Chart-Rows'] = str(len(dates))
+            response.headers['X-Chart-Series'] = ','.join(series)
+        else:
+            response = jsonify({'symbol': stock_code, 'dates': dates, 'series': to_json_columns(columns)})
+        return gzip_response(response)
+    
+    return conditional_response(version, build)
 
 # 确保管理员用户存在
 def ensure_admin_user():
@@ -1537,6 +1431,20 @@ def ensure_admin_user():
 with app.app_context():
     db.create_all()
     ensure_admin_user()
+    migrate_stock_data_to_snapshots()
+    login_stats.ensure_rollups()
+
+# 原始登录日志保留天数，更早的日志由 flask compact-login-logs 归档后删除（汇总数据保留）
+LOGIN_LOG_RETENTION_DAYS = int(os.environ.get('LOGIN_LOG_RETENTION_DAYS', 180))
+LOGIN_LOG_ARCHIVE_DIR = os.environ.get('LOGIN_LOG_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'))
+
+@app.cli.command('compact-login-logs')
+@click.option('--days', default=LOGIN_LOG_RETENTION_DAYS, show_default=True, help='原始登录日志保留天数')
+@click.option('--no-archive', is_flag=True, help='直接删除，不归档')
+def compact_login_logs_command(days, no_archive):
+    """归档并删除超过保留天数的原始登录日志"""
+    deleted = login_stats.compact_login_logs(days, archive_dir=None if no_archive else LOGIN_LOG_ARCHIVE_DIR)
+    click.echo(f'已压缩登录日志 {deleted} 条')
 
 # 管理员路由
 @app.route('/admin')
@@ -1547,14 +1455,11 @@ def admin_dashboard():
         flash('您没有管理员权限', 'danger')
         return redirect(url_for('dashboard'))
     
-    # 获取统计数据
-    stats = {
-        'users_count': User.query.count(),
-        'active_users_count': User.query.filter_by(is_active=True).count(),
-        'admins_count': User.query.filter_by(is_admin=True).count(),
-        'login_count': LoginLog.query.filter_by(status='success').count(),
-        'failed_login_count': LoginLog.query.filter_by(status='failed').count()
-    }
+    # 获取统计数据：用户数一次聚合查询，登录次数读取按天汇总
+    stats = login_stats.user_counts()
+    login_totals = login_stats.login_totals()
+    stats['login_count'] = login_totals.get('success', 0)
+    stats['failed_login_count'] = login_totals.get('failed', 0)
     
     # 获取最近登录记录
     recent_logins = LoginLog.query.order_by(LoginLog.login_time.desc()).limit(10).all()
@@ -1575,7 +1480,8 @@ def admin_users():
     # 标记用户在管理后台
     session['from_admin'] = True
     
-    users = User.query.all()
+    page = request.args.get('page', 1, type=int)
+    users = login_stats.paginate_users(page)
     return render_template('admin/users.html', users=users)
 
 @app.route('/admin/users/edit/<int:id>', methods=['GET', 'POST'])
@@ -1607,7 +1513,8 @@ def admin_edit_user(id):
         flash('用户信息已更新', 'success')
         return redirect(url_for('admin_users'))
     
-    return render_template('admin/edit_user.html', user=user, LoginLog=LoginLog)
+    recent_logs = user.login_logs.order_by(LoginLog.login_time.desc(), LoginLog.id.desc()).limit(5).all()
+    return render_template('admin/edit_user.html', user=user, recent_logs=recent_logs)
 
 @app.route('/admin/users/delete/<int:id>', methods=['POST'])
 @login_required
@@ -1622,12 +1529,23 @@ def admin_delete_user(id):
         return redirect(url_for('admin_users'))
     
     user = User.query.get_or_404(id)
+    login_stats.remove_user_stats(user.id)
     db.session.delete(user)
     db.session.commit()
     
     flash(f'用户 {user.username} 已删除', 'success')
     return redirect(url_for('admin_users'))
 
+@app.route('/admin/cache-stats')
+@login_required
+def admin_cache_stats():
+    """当前进程各缓存命名空间的命中率、容量和淘汰统计"""
+    if not current_user.is_admin:
+        flash('您没有管理员权限', 'danger')
+        return redirect(url_for('dashboard'))
+
+    return jsonify({'pid': os.getpid(), 'caches': cache_stats()})
+
 @app.route('/admin/login-logs')
 @login_required
 def admin_login_logs():
@@ -1639,12 +1557,31 @@ def admin_login_logs():
     # 标记用户在管理后台
     session['from_admin'] = True
     
-    page = request.args.get('page', 1, type=int)
-    logs = LoginLog.query.order_by(LoginLog.login_time.desc()).paginate(
-        page=page, per_page=20, error_out=False
+    # 按 (login_time, id) 游标分页，页数再深也只读取一页数据，不统计总数
+    filters = login_logs.parse_filters(request.args)
+    logs = login_logs.fetch_page(
+        filters,
+        after=request.args.get('after'),
+        before=request.args.get('before')
     )
     
-    return render_template('admin/login_logs.html', logs=logs)
+    return render_template('admin/login_logs.html', logs=logs, filters=filters)
+
+@app.route('/admin/login-logs/export')
+@login_required
+def admin_export_login_logs():
+    """按筛选条件流式导出登录日志CSV"""
+    if not current_user.is_admin:
+        flash('您没有管理员权限', 'danger')
+        return redirect(url_for('dashboard'))
+    
+    filters = login_logs.parse_filters(request.args)
+    filename = f"login_logs_{get_beijing_time().strftime('%Y%m%d%H%M%S')}.csv"
+    return Response(
+        stream_with_context(login_logs.iter_csv(filters)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 @app.route('/admin/users/add', methods=['GET', 'POST'])
 @login_required
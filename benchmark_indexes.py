@@ -0,0 +1,145 @@
+"""索引基准测试
+
+在临时SQLite数据库中按当前模型建表并写入大量模拟数据，分别在没有索引和
+有索引（与 migrations/versions/7c3e1f9a2b64 相同）时输出常用查询的
+EXPLAIN QUERY PLAN 和耗时。
+
+用法:
+    python benchmark_indexes.py --users 5000 --holdings 20 --logs 1000000
+"""
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from models import db
+
+# 应用中的热点查询（与ORM生成的SQL等价）
+QUERIES = [
+    ('持仓按 (user_id, symbol) 查询',
+     'SELECT * FROM user_portfolio WHERE user_id = ? AND symbol = ? LIMIT 1',
+     lambda args: (random.randint(1, args.users), f"{random.randint(0, args.holdings * 4):06d}")),
+    ('用户持仓列表',
+     'SELECT * FROM user_portfolio WHERE user_id = ?',
+     lambda args: (random.randint(1, args.users),)),
+    ('最近登录记录',
+     'SELECT * FROM login_log ORDER BY login_time DESC LIMIT 10',
+     lambda args: ()),
+    ('登录日志分页（第100页）',
+     'SELECT * FROM login_log ORDER BY login_time DESC LIMIT 20 OFFSET 1980',
+     lambda args: ()),
+    ('失败登录计数',
+     "SELECT count(*) FROM login_log WHERE status = 'failed'",
+     lambda args: ()),
+    ('单个用户的最近登录',
+     'SELECT * FROM login_log WHERE user_id = ? ORDER BY login_time DESC LIMIT 20',
+     lambda args: (random.randint(1, args.users),)),
+]
+
+# 迁移添加的索引
+INDEX_NAMES = [
+    'ix_user_portfolio_user_id_symbol',
+    'ix_login_log_login_time',
+    'ix_login_log_user_id_login_time',
+    'ix_login_log_status',
+]
+
+
+def seed(path, args):
+    """按模型建表并写入模拟数据"""
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine, tables=[
+        db.metadata.tables['user'],
+        db.metadata.tables['login_log'],
+        db.metadata.tables['user_portfolio'],
+    ])
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    # 先删除索引再批量写入，与未迁移的旧库一致
+    for name in INDEX_NAMES:
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+
+    started = datetime(2024, 1, 1)
+    conn.executemany(
+        'INSERT INTO user (id, username, email, is_active, is_admin) VALUES (?, ?, ?, 1, 0)',
+        ((i, f'user{i}', f'user{i}@example.com') for i in range(1, args.users + 1))
+    )
+    conn.executemany(
+        'INSERT INTO user_portfolio (user_id, symbol, name) VALUES (?, ?, ?)',
+        ((user_id, f"{symbol:06d}", f'股票{symbol}')
+         for user_id in range(1, args.users + 1)
+         for symbol in random.sample(range(args.holdings * 4), args.holdings))
+    )
+    conn.executemany(
+        'INSERT INTO login_log (user_id, login_time, ip_address, status) VALUES (?, ?, ?, ?)',
+        ((random.randint(1, args.users),
+          (started + timedelta(seconds=random.randint(0, 365 * 24 * 3600))).strftime('%Y-%m-%d %H:%M:%S.%f'),
+          f'10.0.{random.randint(0, 255)}.{random.randint(0, 255)}',
+          'failed' if random.random() < 0.05 else 'success')
+         for _ in range(args.logs))
+    )
+    conn.commit()
+    return conn
+
+
+def create_indexes(conn):
+    """创建与迁移相同的索引"""
+    conn.execute('CREATE UNIQUE INDEX ix_user_portfolio_user_id_symbol ON user_portfolio (user_id, symbol)')
+    conn.execute('CREATE INDEX ix_login_log_login_time ON login_log (login_time)')
+    conn.execute('CREATE INDEX ix_login_log_user_id_login_time ON login_log (user_id, login_time)')
+    conn.execute('CREATE INDEX ix_login_log_status ON login_log (status)')
+    conn.execute('ANALYZE')
+    conn.commit()
+
+
+def run_queries(conn, args, label):
+    """输出每个查询的执行计划和中位耗时"""
+    print(f"\n===== {label} =====")
+    for title, sql, make_params in QUERIES:
+        plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', make_params(args)).fetchall()
+        timings = []
+        for _ in range(args.repeat):
+            params = make_params(args)
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f"\n{title}: 中位耗时 {timings[len(timings) // 2] * 1000:.3f} ms")
+        for row in plan:
+            print(f"    {row[-1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='持仓和登录日志索引基准测试')
+    parser.add_argument('--users', type=int, default=5000, help='用户数')
+    parser.add_argument('--holdings', type=int, default=20, help='每个用户的持仓数')
+    parser.add_argument('--logs', type=int, default=1000000, help='登录日志条数')
+    parser.add_argument('--repeat', type=int, default=20, help='每个查询的执行次数')
+    parser.add_argument('--seed', type=int, default=42, help='随机数种子')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        conn = seed(path, args)
+        print(f"已生成 {args.users} 个用户、{args.users * args.holdings} 条持仓、{args.logs} 条登录日志，"
+              f"耗时 {time.perf_counter() - start:.1f} 秒")
+
+        run_queries(conn, args, '无索引')
+        start = time.perf_counter()
+        create_indexes(conn)
+        print(f"\n创建索引耗时 {time.perf_counter() - start:.1f} 秒")
+        run_queries(conn, args, '有索引')
+        conn.close()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
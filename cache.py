@@ -0,0 +1,207 @@
+import sys
+import time
+import threading
+import functools
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+_MISSING = object()
+
+
+def estimate_size(value, _depth=0):
+    """估算对象占用的内存（字节）
+
+    NumPy数组和DataFrame按数据大小计算，容器递归累加（最多3层），其余对象使用 sys.getsizeof。
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(index=True, deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    size = sys.getsizeof(value)
+    if _depth >= 3:
+        return size
+    if isinstance(value, dict):
+        size += sum(estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _depth + 1) for item in value)
+    return size
+
+
+class TTLCache:
+    """带有效期和LRU淘汰的进程内缓存
+
+    条目超过 ttl 秒后视为过期；条目数超过 max_entries 或估算大小超过 max_bytes 时，
+    淘汰最久未使用的条目。命中、未命中、过期和淘汰次数记录在 stats() 中。
+    """
+
+    def __init__(self, name, ttl=None, max_entries=None, max_bytes=None, sizeof=estimate_size):
+        """
+        Args:
+            name: 命名空间，用于统计
+            ttl: 默认有效期（秒），None表示不过期
+            max_entries: 最大条目数，None表示不限制
+            max_bytes: 最大估算字节数，None表示不限制
+            sizeof: 估算单个值大小的函数
+        """
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key, default=None):
+        """获取未过期的值，不存在或已过期时返回default"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, _ = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=_MISSING):
+        """写入值
+
+        Args:
+            ttl: 本条目的有效期（秒），未指定时使用命名空间的默认值，None表示不过期
+        """
+        ttl = self.ttl if ttl is _MISSING else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        size = self._sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                # 单个值超过容量上限，不缓存
+                self.evictions += 1
+                return
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while ((self.max_entries is not None and len(self._entries) > self.max_entries) or
+                   (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key):
+        """删除条目，不存在时忽略"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_or_set(self, key, compute, ttl=_MISSING):
+        """获取值，不存在时调用 compute() 计算并写入
+
+        计算期间不持有锁，并发的未命中可能各自计算一次。
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def stats(self):
+        """命中率等统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes if self.max_bytes is not None else None,
+                'ttl': self.ttl,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'expirations': self.expirations,
+                'evictions': self.evictions
+            }
+
+
+# 进程内按命名空间共享的缓存，以及其他提供 stats() 的缓存
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name, ttl=None, max_entries=None, max_bytes=None):
+    """获取命名空间对应的缓存，同一命名空间在进程内共享一个实例
+
+    Args:
+        name: 命名空间，如 'analysis'
+        ttl: 默认有效期（秒，仅首次创建时生效）
+        max_entries: 最大条目数（仅首次创建时生效）
+        max_bytes: 最大估算字节数（仅首次创建时生效）
+    """
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = _caches[name] = TTLCache(name, ttl=ttl, max_entries=max_entries, max_bytes=max_bytes)
+        return cache
+
+
+def register_cache(name, cache):
+    """登记不基于 TTLCache 的缓存（需提供 stats()），使其出现在 cache_stats() 中"""
+    with _caches_lock:
+        _caches[name] = cache
+
+
+def cache_stats():
+    """所有命名空间的统计信息
+
+    Returns:
+        dict: 命名空间 -> stats()
+    """
+    with _caches_lock:
+        caches = dict(_caches)
+    return {name: cache.stats() for name, cache in sorted(caches.items())}
+
+
+def cached(name, ttl=None, max_entries=None, max_bytes=None, key=None):
+    """缓存函数结果的装饰器，用于包装数据源调用
+
+    Args:
+        name: 命名空间
+        ttl, max_entries, max_bytes: 同 get_cache
+        key: 由调用参数生成缓存key的函数，默认使用全部位置参数和关键字参数
+
+    抛出异常的调用不缓存。被装饰的函数可通过 .cache 访问对应的 TTLCache。
+    """
+    def decorator(func):
+        cache = get_cache(name, ttl=ttl, max_entries=max_entries, max_bytes=max_bytes)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs) if key is not None else (args, tuple(sorted(kwargs.items())))
+            return cache.get_or_set(cache_key, lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,91 @@
+import math
+import numpy as np
+from indicators import calculate_indicators
+
+# 日线中可直接返回的序列
+BAR_SERIES = ('open', 'close', 'high', 'low', 'vol', 'amount')
+
+# 需要先计算技术指标的序列
+INDICATOR_SERIES = (
+    'RSI', 'MACD', 'Signal', 'MA5', 'MA10', 'MA20', 'MA60', 'Volatility',
+    'BBand_middle', 'BBand_upper', 'BBand_lower', 'Strength'
+)
+
+DEFAULT_SERIES = ('close', 'vol')
+
+# JSON格式保留的小数位数
+JSON_DECIMALS = 4
+
+
+def parse_series(value):
+    """解析逗号分隔的序列名，未指定时返回默认序列
+
+    Raises:
+        ValueError: 包含不支持的序列名
+    """
+    if not value:
+        return list(DEFAULT_SERIES)
+    series = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in series if name not in BAR_SERIES + INDICATOR_SERIES]
+    if unknown:
+        raise ValueError(f"不支持的序列: {', '.join(unknown)}")
+    return series
+
+
+def chart_columns(df, series):
+    """从日线中取出请求的序列，只在需要时计算技术指标
+
+    Args:
+        df: 日线DataFrame，列为 trade_date, open, close, high, low, vol, amount
+        series: 序列名列表
+
+    Returns:
+        tuple: (日期列表, dict 序列名 -> float64数组)
+    """
+    if any(name in INDICATOR_SERIES for name in series) and not df.empty:
+        df = calculate_indicators(df.copy())
+    dates = df['trade_date'].astype(str).tolist()
+    columns = {}
+    for name in series:
+        if name in df.columns:
+            columns[name] = df[name].to_numpy(dtype=np.float64)
+        else:
+            columns[name] = np.full(len(df), np.nan)
+    return dates, columns
+
+
+def json_safe(value):
+    """递归转换为严格JSON可表示的值：NaN和无穷大转换为None，numpy标量转换为Python值
+
+    json.dumps 默认把NaN输出为 NaN，浏览器的 JSON.parse 和严格的JSON客户端无法解析。
+    """
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def to_json_columns(columns):
+    """列数组转换为JSON列表，NaN转换为null"""
+    result = {}
+    for name, values in columns.items():
+        rounded = np.round(values, JSON_DECIMALS)
+        result[name] = [None if np.isnan(value) else value for value in rounded.tolist()]
+    return result
+
+
+def to_float32_buffer(dates, columns):
+    """编码为二进制缓冲区（小端序）
+
+    布局：n个uint32日期（YYYYMMDD），随后按序列顺序依次为n个float32值，缺失值为NaN。
+    """
+    day_numbers = np.array([int(date.replace('-', '')) for date in dates], dtype='<u4')
+    parts = [day_numbers.tobytes()]
+    for values in columns.values():
+        parts.append(values.astype('<f4').tobytes())
+    return b''.join(parts)
@@ -0,0 +1,134 @@
+import time
+import random
+import threading
+import logging
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """令牌桶限流器
+
+    以 rate 个/秒的速度补充令牌，最多累积 capacity 个，
+    每次上游调用前取一个令牌，避免并发请求触发数据源限流。
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1, timeout=None):
+        """获取令牌，令牌不足时等待
+
+        Args:
+            tokens: 需要的令牌数
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            bool: 是否成功获取
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+# 各数据源共享的限流器
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider, rate=5, capacity=10):
+    """获取数据源对应的限流器，同一数据源在进程内共享一个令牌桶
+
+    Args:
+        provider: 数据源名称，如 'eastmoney'
+        rate: 每秒补充的令牌数（仅首次创建时生效）
+        capacity: 令牌桶容量（仅首次创建时生效）
+    """
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(provider)
+        if limiter is None:
+            limiter = _rate_limiters[provider] = TokenBucket(rate, capacity)
+        return limiter
+
+
+class Deadline:
+    """请求级时间预算，同一请求内的多个上游调用共享剩余时间"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        """剩余时间（秒），不小于0"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+
+def run_with_deadline(executor, func, deadline, *args, **kwargs):
+    """在线程池中执行上游调用，最多等待到截止时间
+
+    超时后立即抛出 TimeoutError 返回调用方，上游调用本身在后台线程中继续执行完毕。
+
+    Args:
+        executor: 执行调用的线程池
+        func: 上游接口函数
+        deadline: Deadline
+    """
+    if deadline.expired:
+        raise TimeoutError("请求时间预算已用完")
+    future = executor.submit(func, *args, **kwargs)
+    try:
+        return future.result(timeout=deadline.remaining())
+    except concurrent.futures.TimeoutError:
+        raise TimeoutError(f"调用 {getattr(func, '__name__', func)} 超过 {deadline.seconds} 秒时间预算")
+
+
+def call_with_retry(func, *args, retries=2, backoff=0.5, max_backoff=8.0, limiter=None, **kwargs):
+    """调用上游接口，失败时按指数退避加随机抖动重试
+
+    Args:
+        func: 上游接口函数
+        retries: 失败后的最大重试次数
+        backoff: 首次重试的退避基数（秒）
+        max_backoff: 单次退避上限（秒）
+        limiter: 可选的 TokenBucket，每次调用前获取令牌
+
+    Returns:
+        上游接口的返回值，重试耗尽时抛出最后一次的异常
+    """
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt >= retries:
+                raise
+            # full jitter: 在 [0, backoff * 2^attempt] 内随机等待，分散同时失败的请求
+            delay = random.uniform(0, min(max_backoff, backoff * (2 ** attempt)))
+            logger.warning(f"调用 {getattr(func, '__name__', func)} 失败（第 {attempt + 1} 次）: {str(e)}，{delay:.2f} 秒后重试")
+            time.sleep(delay)
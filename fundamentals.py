@@ -0,0 +1,216 @@
+import json
+import time
+import logging
+from contextlib import closing
+from datetime import date
+import pandas as pd
+from models import get_beijing_time
+from history_store import MARKET_DB_PATH, connect
+from cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+# 财务摘要列名 -> 模板使用的字段名
+FINA_COLUMN_MAP = {
+    '截止日期': 'end_date',
+    '基本每股收益': 'basic_eps',
+    '每股净资产': 'bps',
+    '净资产收益率': 'roe',
+    '销售净利率': 'net_profit_margin'
+}
+
+# A股定期报告：报告期截止日 -> 法定披露截止日（月, 日, 相对报告期的年份偏移）
+REPORT_DEADLINES = [
+    ((3, 31), (4, 30, 0)),   # 一季报
+    ((6, 30), (8, 31, 0)),   # 半年报
+    ((9, 30), (10, 31, 0)),  # 三季报
+    ((12, 31), (4, 30, 1)),  # 年报
+]
+
+# 定期报告集中披露的月份
+REPORTING_SEASON_MONTHS = (1, 2, 3, 4, 7, 8, 10)
+
+
+def _json_value(value):
+    """将numpy标量转换为可JSON序列化的Python值"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def normalize_financials(df):
+    """将 ak.stock_financial_abstract 的结果转换为模板使用的记录列表"""
+    if df is None or df.empty:
+        return []
+    records = []
+    columns = {source: target for source, target in FINA_COLUMN_MAP.items() if source in df.columns}
+    for row in df[list(columns)].itertuples(index=False, name=None):
+        record = {'end_date': "", 'basic_eps': 0, 'bps': 0, 'roe': 0, 'roa': 0, 'net_profit_margin': 0}
+        for target, value in zip(columns.values(), row):
+            record[target] = _json_value(value)
+        record['end_date'] = str(record['end_date'])
+        records.append(record)
+    return records
+
+
+def normalize_period(value):
+    """报告期统一为 YYYY-MM-DD，无法解析时返回空字符串"""
+    try:
+        return pd.Timestamp(str(value)).strftime('%Y-%m-%d')
+    except (ValueError, TypeError):
+        return ""
+
+
+def expected_report_period(today):
+    """按披露截止日推算当前应已披露的最新报告期
+
+    Args:
+        today: date
+
+    Returns:
+        str: 报告期，YYYY-MM-DD
+    """
+    latest = None
+    for year in (today.year - 2, today.year - 1, today.year):
+        for (period_month, period_day), (deadline_month, deadline_day, offset) in REPORT_DEADLINES:
+            deadline = date(year + offset, deadline_month, deadline_day)
+            if deadline <= today:
+                period = date(year, period_month, period_day)
+                if latest is None or period > latest:
+                    latest = period
+    return latest.strftime('%Y-%m-%d')
+
+
+class FundamentalsCache:
+    """按报告期缓存的财务摘要
+
+    财务数据只在新报告披露时变化：本地已有应披露的最新报告期时，
+    非披露季只做低频校验，披露季内每天最多向上游确认一次。
+    结果同时保存在SQLite（跨重启）和进程内的有界LRU缓存（微秒级读取）中。
+    """
+
+    def __init__(self, fetch, path=MARKET_DB_PATH, season_interval=24 * 3600, off_season_interval=30 * 24 * 3600, cache=None):
+        """
+        Args:
+            fetch: 获取财务摘要的函数，如 ak.stock_financial_abstract
+            path: SQLite数据库路径
+            season_interval: 披露季内或缺少应披露报告时的校验间隔（秒）
+            off_season_interval: 非披露季的校验间隔（秒）
+            cache: 进程内缓存（cache.TTLCache），默认使用 'fundamentals' 命名空间
+        """
+        self._fetch = fetch
+        self.path = path
+        self.season_interval = season_interval
+        self.off_season_interval = off_season_interval
+        self._memory = cache if cache is not None else get_cache('fundamentals')
+        self._init_schema()
+
+    def _connect(self):
+        return connect(self.path)
+
+    def _init_schema(self):
+        with closing(self._connect()) as conn, conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS fundamentals (
+                    symbol TEXT NOT NULL,
+                    report_period TEXT NOT NULL,
+                    record TEXT NOT NULL,
+                    PRIMARY KEY (symbol, report_period)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS fundamentals_sync (
+                    symbol TEXT PRIMARY KEY,
+                    latest_period TEXT,
+                    checked_at REAL
+                )
+            ''')
+
+    def read(self, symbol):
+        """读取本地缓存，不访问上游
+
+        Returns:
+            dict: {'records', 'latest_period', 'checked_at'}，没有缓存时返回None
+        """
+        entry = self._memory.get(symbol)
+        if entry is not None:
+            return entry
+        with closing(self._connect()) as conn:
+            sync = conn.execute(
+                'SELECT latest_period, checked_at FROM fundamentals_sync WHERE symbol = ?', (symbol,)
+            ).fetchone()
+            if sync is None:
+                return None
+            rows = conn.execute(
+                'SELECT record FROM fundamentals WHERE symbol = ? ORDER BY report_period DESC', (symbol,)
+            ).fetchall()
+        entry = {
+            'records': [json.loads(row[0]) for row in rows],
+            'latest_period': sync[0],
+            'checked_at': sync[1]
+        }
+        self._memory.set(symbol, entry)
+        return entry
+
+    def needs_revalidation(self, entry, now=None):
+        """判断缓存是否需要向上游确认"""
+        if entry is None:
+            return True
+        now = now or time.time()
+        today = get_beijing_time().date()
+        age = now - (entry['checked_at'] or 0)
+        missing_report = (entry['latest_period'] or "") < expected_report_period(today)
+        if missing_report or today.month in REPORTING_SEASON_MONTHS:
+            return age > self.season_interval
+        return age > self.off_season_interval
+
+    def refresh(self, symbol):
+        """从上游获取财务摘要并写入缓存
+
+        Returns:
+            list: 财务记录
+        """
+        records = normalize_financials(self._fetch(stock=symbol))
+        periods = {}
+        for record in records:
+            period = normalize_period(record['end_date']) or record['end_date']
+            if period:
+                periods[period] = record
+        latest_period = max(periods) if periods else None
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM fundamentals WHERE symbol = ?', (symbol,))
+            conn.executemany(
+                'INSERT OR REPLACE INTO fundamentals (symbol, report_period, record) VALUES (?, ?, ?)',
+                [(symbol, period, json.dumps(record, ensure_ascii=False)) for period, record in periods.items()]
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO fundamentals_sync (symbol, latest_period, checked_at) VALUES (?, ?, ?)',
+                (symbol, latest_period, now)
+            )
+        entry = {
+            'records': [periods[period] for period in sorted(periods, reverse=True)],
+            'latest_period': latest_period,
+            'checked_at': now
+        }
+        self._memory.set(symbol, entry)
+        return entry['records']
+
+    def get(self, symbol):
+        """获取财务摘要，只在需要时向上游确认
+
+        上游失败时返回本地已有数据；本地也没有时抛出异常。
+
+        Returns:
+            list: 财务记录，按报告期倒序
+        """
+        entry = self.read(symbol)
+        if not self.needs_revalidation(entry):
+            return entry['records']
+        try:
+            return self.refresh(symbol)
+        except Exception as e:
+            if entry is None:
+                raise
+            logger.error(f"更新 {symbol} 财务摘要失败，使用本地缓存: {str(e)}")
+            return entry['records']
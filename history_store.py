@@ -0,0 +1,352 @@
+import os
+import time
+import sqlite3
+import logging
+import concurrent.futures
+from contextlib import closing
+from datetime import datetime, timedelta
+import pandas as pd
+from models import get_beijing_time
+from data_provider import call_with_retry
+from indicators import IndicatorState
+
+logger = logging.getLogger(__name__)
+
+# 本地行情数据库，与用户数据库 app.db 分开存放
+MARKET_DB_PATH = os.environ.get('MARKET_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'market.db'))
+
+# akshare 日线列名 -> 模板和指标计算使用的列名
+HIST_COLUMN_MAP = {
+    '日期': 'trade_date',
+    '开盘': 'open',
+    '收盘': 'close',
+    '最高': 'high',
+    '最低': 'low',
+    '成交量': 'vol',
+    '成交额': 'amount'
+}
+BAR_COLUMNS = ['trade_date', 'open', 'close', 'high', 'low', 'vol', 'amount']
+
+
+def connect(path=MARKET_DB_PATH):
+    """打开本地行情数据库连接（WAL模式，允许读写并发）"""
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def normalize_bars(df):
+    """将 ak.stock_zh_a_hist 的结果转换为统一列名，日期统一为 YYYY-MM-DD 字符串"""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    df = df.rename(columns=HIST_COLUMN_MAP)
+    df = df[[column for column in BAR_COLUMNS if column in df.columns]].copy()
+    df['trade_date'] = pd.to_datetime(df['trade_date']).dt.strftime('%Y-%m-%d')
+    return df.reindex(columns=BAR_COLUMNS)
+
+
+class HistoryStore:
+    """本地日线（前复权OHLCV）存储
+
+    每只股票的日线保存在SQLite中，同步时只向上游请求最后一根已存K线之后的数据，
+    页面按需从本地读取最近N天的窗口。前复权价格会在除权除息后整体变化，
+    因此同步时会比对重叠的最后一根K线，发现不一致则重新拉取整个窗口。
+    """
+
+    def __init__(self, fetch, path=MARKET_DB_PATH, window_days=180, sync_interval=600,
+                 max_workers=8, rate_limiter=None, retries=2):
+        """
+        Args:
+            fetch: 获取日线的函数，如 ak.stock_zh_a_hist
+            path: SQLite数据库路径
+            window_days: 默认读取和首次同步的自然日窗口
+            sync_interval: 同一股票两次同步的最小间隔（秒）
+            max_workers: 批量同步时的最大并发数
+            rate_limiter: 上游请求共享的 TokenBucket
+            retries: 单只股票请求失败后的重试次数
+        """
+        self._fetch = fetch
+        self.path = path
+        self.window_days = window_days
+        self.sync_interval = sync_interval
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='history-sync'
+        )
+        self._init_schema()
+
+    def _connect(self):
+        return connect(self.path)
+
+    def _init_schema(self):
+        with closing(self._connect()) as conn, conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS daily_bars (
+                    symbol TEXT NOT NULL,
+                    trade_date TEXT NOT NULL,
+                    open REAL,
+                    close REAL,
+                    high REAL,
+                    low REAL,
+                    vol REAL,
+                    amount REAL,
+                    PRIMARY KEY (symbol, trade_date)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS history_sync (
+                    symbol TEXT PRIMARY KEY,
+                    last_bar TEXT,
+                    synced_at REAL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS indicator_state (
+                    symbol TEXT PRIMARY KEY,
+                    last_bar TEXT,
+                    state TEXT NOT NULL
+                )
+            ''')
+
+    def _fetch_bars(self, symbol, start, end):
+        df = call_with_retry(
+            self._fetch,
+            retries=self.retries,
+            limiter=self.rate_limiter,
+            symbol=symbol,
+            period="daily",
+            start_date=start.strftime('%Y%m%d'),
+            end_date=end.strftime('%Y%m%d'),
+            adjust="qfq"
+        )
+        return normalize_bars(df)
+
+    def sync(self, symbol, force=False):
+        """增量同步一只股票的日线
+
+        Args:
+            symbol: 股票代码
+            force: 是否忽略同步间隔强制同步
+
+        Returns:
+            int: 本次写入的K线数量
+        """
+        end = get_beijing_time()
+        today = end.strftime('%Y-%m-%d')
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                'SELECT last_bar, synced_at FROM history_sync WHERE symbol = ?', (symbol,)
+            ).fetchone()
+            # 复权校验使用最后一根已收盘的K线：盘中当天K线的收盘价一直在变化，不能用来判断复权
+            check_row = None
+            if row and row[0]:
+                check_row = conn.execute(
+                    'SELECT trade_date, close FROM daily_bars WHERE symbol = ? AND trade_date <= ? AND trade_date < ? '
+                    'ORDER BY trade_date DESC LIMIT 1', (symbol, row[0], today)
+                ).fetchone()
+
+        now = time.time()
+        if row and not force and now - (row[1] or 0) < self.sync_interval:
+            return 0
+
+        window_start = end - timedelta(days=self.window_days)
+        last_bar = row[0] if row else None
+        full = (
+            last_bar is None or last_bar < window_start.strftime('%Y-%m-%d') or
+            # 同步记录存在但本地缺少已收盘的K线
+            (check_row is None and last_bar < today)
+        )
+
+        # 从最后一根已收盘K线（含）开始请求，既能覆盖盘中未收盘的K线，也能用于复权校验；
+        # 本地只有当天K线时没有可校验的K线，从最后一根K线开始请求
+        check_bar, stored_close = check_row if check_row else (None, None)
+        start = window_start if full else datetime.strptime(check_bar or last_bar, '%Y-%m-%d')
+        bars = self._fetch_bars(symbol, start, end)
+
+        if not full and check_bar is not None and stored_close is not None:
+            overlap = bars[bars['trade_date'] == check_bar]
+            if not overlap.empty and abs(float(overlap['close'].iloc[0]) - stored_close) > 1e-6 * max(1.0, abs(stored_close)):
+                # 前复权基准变化（除权除息），重新拉取整个窗口
+                logger.info(f"{symbol} 复权价格变化，重新同步日线窗口")
+                full = True
+                bars = self._fetch_bars(symbol, window_start, end)
+
+        with closing(self._connect()) as conn, conn:
+            # 只有重新拉取到数据时才替换整个窗口，上游返回空数据时保留本地K线
+            if full and not bars.empty:
+                conn.execute('DELETE FROM daily_bars WHERE symbol = ?', (symbol,))
+            conn.executemany(
+                'INSERT OR REPLACE INTO daily_bars (symbol, trade_date, open, close, high, low, vol, amount) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(symbol, *values) for values in bars[BAR_COLUMNS].itertuples(index=False, name=None)]
+            )
+            new_last_bar = bars['trade_date'].max() if not bars.empty else last_bar
+            conn.execute(
+                'INSERT OR REPLACE INTO history_sync (symbol, last_bar, synced_at) VALUES (?, ?, ?)',
+                (symbol, new_last_bar, now)
+            )
+        return len(bars)
+
+    def read(self, symbol, days=None):
+        """从本地读取最近days个自然日的日线
+
+        Returns:
+            DataFrame: 列为 trade_date, open, close, high, low, vol, amount，按日期升序
+        """
+        start = get_beijing_time() - timedelta(days=days or self.window_days)
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                'SELECT trade_date, open, close, high, low, vol, amount FROM daily_bars '
+                'WHERE symbol = ? AND trade_date >= ? ORDER BY trade_date',
+                conn,
+                params=(symbol, start.strftime('%Y-%m-%d'))
+            )
+
+    def last_quote(self, symbol):
+        """用本地最后两根K线构造行情，作为上游不可用时的最近可用数据
+
+        Returns:
+            dict: 与 MarketSnapshot.get_quote 相同的字段，本地无数据时返回None
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                'SELECT close, vol FROM daily_bars WHERE symbol = ? ORDER BY trade_date DESC LIMIT 2', (symbol,)
+            ).fetchall()
+        if not rows:
+            return None
+        close, vol = rows[0]
+        prev_close = rows[1][0] if len(rows) > 1 else close
+        change = close - prev_close
+        return {
+            "symbol": symbol,
+            "name": "",
+            "industry": "",
+            "current_price": close,
+            "change_pct": change / prev_close * 100 if prev_close else 0,
+            "change_amount": change,
+            "volume": vol or 0,
+            "turnover": 0
+        }
+
+    def get_history(self, symbol, days=None, sync=True, timeout=None):
+        """获取日线数据，先增量同步再从本地读取
+
+        同步失败或超时时记录日志并返回本地已有数据，超时的同步在后台继续完成。
+
+        Args:
+            symbol: 股票代码
+            days: 自然日窗口，默认为 window_days
+            sync: 是否先尝试增量同步
+            timeout: 等待同步的最长时间（秒），None表示等到同步结束
+
+        Returns:
+            DataFrame: 日线数据，可能为空
+        """
+        if sync:
+            try:
+                if timeout is None:
+                    self.sync(symbol)
+                else:
+                    self._executor.submit(self.sync, symbol).result(timeout=timeout)
+            except concurrent.futures.TimeoutError:
+                logger.warning(f"同步 {symbol} 日线超过 {timeout:.1f} 秒，使用本地数据")
+            except Exception as e:
+                logger.error(f"同步 {symbol} 日线失败，使用本地数据: {str(e)}")
+        return self.read(symbol, days)
+
+    def sync_many(self, symbols):
+        """并发增量同步多只股票，并发数受 max_workers 和限流器约束
+
+        Returns:
+            dict: 股票代码 -> 同步失败的异常，全部成功时为空
+        """
+        errors = {}
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return errors
+        futures = {self._executor.submit(self.sync, symbol): symbol for symbol in symbols}
+        for future in concurrent.futures.as_completed(futures):
+            symbol = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"同步 {symbol} 日线失败，使用本地数据: {str(e)}")
+                errors[symbol] = e
+        return errors
+
+    def read_many(self, symbols, days=None):
+        """用一次查询从本地读取多只股票的日线
+
+        Returns:
+            dict: 股票代码 -> 日线DataFrame，本地没有数据的股票对应空DataFrame
+        """
+        symbols = list(dict.fromkeys(symbols))
+        result = {symbol: pd.DataFrame(columns=BAR_COLUMNS) for symbol in symbols}
+        if not symbols:
+            return result
+        start = get_beijing_time() - timedelta(days=days or self.window_days)
+        placeholders = ','.join('?' * len(symbols))
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(
+                f'SELECT symbol, trade_date, open, close, high, low, vol, amount FROM daily_bars '
+                f'WHERE symbol IN ({placeholders}) AND trade_date >= ? ORDER BY symbol, trade_date',
+                conn,
+                params=(*symbols, start.strftime('%Y-%m-%d'))
+            )
+        for symbol, group in df.groupby('symbol', sort=False):
+            result[symbol] = group[BAR_COLUMNS].reset_index(drop=True)
+        return result
+
+    def bar_versions(self, symbols):
+        """读取多只股票日线的同步版本，每次写入日线后版本都会变化
+
+        Returns:
+            dict: 股票代码 -> (最后一根K线日期, 同步时间)，从未同步过的股票对应None
+        """
+        symbols = list(dict.fromkeys(symbols))
+        versions = {symbol: None for symbol in symbols}
+        if not symbols:
+            return versions
+        placeholders = ','.join('?' * len(symbols))
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f'SELECT symbol, last_bar, synced_at FROM history_sync WHERE symbol IN ({placeholders})', symbols
+            ).fetchall()
+        for symbol, last_bar, synced_at in rows:
+            versions[symbol] = (last_bar, synced_at)
+        return versions
+
+    def load_indicator_states(self, symbols):
+        """读取多只股票的增量指标状态
+
+        Returns:
+            dict: 股票代码 -> IndicatorState，没有状态的股票不包含在结果中
+        """
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return {}
+        placeholders = ','.join('?' * len(symbols))
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f'SELECT symbol, state FROM indicator_state WHERE symbol IN ({placeholders})', symbols
+            ).fetchall()
+        states = {}
+        for symbol, text in rows:
+            try:
+                states[symbol] = IndicatorState.loads(text)
+            except Exception as e:
+                logger.error(f"读取 {symbol} 指标状态失败: {str(e)}")
+        return states
+
+    def save_indicator_states(self, states):
+        """批量保存增量指标状态"""
+        if not states:
+            return
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO indicator_state (symbol, last_bar, state) VALUES (?, ?, ?)',
+                [(symbol, state.last_bar, state.dumps()) for symbol, state in states.items()]
+            )
@@ -0,0 +1,679 @@
+import math
+import json
+import bisect
+from collections import deque
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+def get_recommendation(score):
+    """根据总分生成投资建议"""
+    if score >= 80:
+        return "强烈推荐买入"
+    elif score >= 60:
+        return "建议买入"
+    elif score >= 40:
+        return "建议观望"
+    elif score >= 20:
+        return "建议减持"
+    return "建议卖出"
+
+INSUFFICIENT_DATA_RESULT = {
+    "trend": "数据不足",
+    "volatility": 0,
+    "rsi": 0,
+    "rsi_signal": "数据不足",
+    "macd_signal": "数据不足",
+    "volume_trend": "数据不足",
+    "score": 50,
+    "recommendation": "数据不足"
+}
+
+def calculate_indicators(df):
+    """计算技术指标"""
+    try:
+        # 计算RSI
+        delta = df['close'].diff()
+        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
+        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
+        rs = gain / loss
+        df['RSI'] = 100 - (100 / (1 + rs))
+        
+        # 计算MACD
+        exp1 = df['close'].ewm(span=12, adjust=False).mean()
+        exp2 = df['close'].ewm(span=26, adjust=False).mean()
+        df['MACD'] = exp1 - exp2
+        df['Signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
+        
+        # 计算MA
+        df['MA5'] = df['close'].rolling(window=5).mean()
+        df['MA10'] = df['close'].rolling(window=10).mean()
+        df['MA20'] = df['close'].rolling(window=20).mean()
+        df['MA60'] = df['close'].rolling(window=60).mean()
+        
+        # 计算波动率
+        df['Volatility'] = df['close'].pct_change().rolling(window=20).std() * np.sqrt(252) * 100
+        
+        # 计算布林带
+        df['BBand_middle'] = df['close'].rolling(window=20).mean()
+        std = df['close'].rolling(window=20).std()
+        df['BBand_upper'] = df['BBand_middle'] + (2 * std)
+        df['BBand_lower'] = df['BBand_middle'] - (2 * std)
+        
+        # 计算相对强度
+        df['Strength'] = (df['close'] - df['close'].rolling(window=60).min()) / (df['close'].rolling(window=60).max() - df['close'].rolling(window=60).min()) * 100
+        
+        return df
+        
+    except Exception as e:
+        print(f"计算技术指标失败: {str(e)}")
+        return df
+
+def analyze_indicators(df):
+    """分析技术指标生成报告和评分，使用@StockAnalysis的评分逻辑"""
+    try:
+        if len(df) < 20:
+            return dict(INSUFFICIENT_DATA_RESULT)
+            
+        latest = df.iloc[-1]
+        
+        # 趋势分析
+        trend = "上升" if latest['MA5'] > latest['MA20'] else "下降"
+        
+        # 波动性分析
+        volatility = float(latest['Volatility'])
+        
+        # RSI分析
+        rsi = float(latest['RSI'])
+        rsi_signal = "超买" if rsi > 70 else "超卖" if rsi < 30 else "中性"
+        
+        # MACD分析
+        macd_signal = "买入" if latest['MACD'] > latest['Signal'] else "卖出"
+        
+        # 成交量分析 - 使用近5日平均与近20日平均比较
+        recent_vol_avg = df['vol'].iloc[-5:].mean()
+        long_vol_avg = df['vol'].iloc[-20:].mean()
+        volume_trend = "放量" if recent_vol_avg > long_vol_avg else "缩量"
+        
+        # 记录计算过程，便于调试
+        recent_vol = recent_vol_avg
+        last_vol = float(latest['vol'])
+        
+        # 计算布林带位置
+        bband_position = (latest['close'] - latest['BBand_lower']) / (latest['BBand_upper'] - latest['BBand_lower']) * 100
+        bband_signal = "超卖区" if bband_position < 20 else "超买区" if bband_position > 80 else "中性"
+        
+        # 使用@StockAnalysis的评分逻辑
+        score = 0
+        score += 30 if trend == "上升" else 0
+        score += 20 if 30 < rsi < 70 else 0
+        score += 20 if macd_signal == "买入" else 0
+        score += 15 if volume_trend == "放量" else 0
+        score += 15 if volatility < 30 else 0
+        
+        print(f"DEBUG - 详细分析页面评分计算:")
+        print(f"  趋势(30分): {trend} -> {30 if trend == '上升' else 0}分")
+        print(f"  RSI(20分): {rsi:.2f} -> {20 if 30 < rsi < 70 else 0}分")
+        print(f"  MACD(20分): {macd_signal} -> {20 if macd_signal == '买入' else 0}分")
+        print(f"  成交量(15分): {volume_trend}(最新:{last_vol:.0f}, 近5日均:{recent_vol:.0f}) -> {15 if volume_trend == '放量' else 0}分")
+        print(f"  波动率(15分): {volatility:.2f}% -> {15 if volatility < 30 else 0}分")
+        print(f"  总分: {score}分")
+        
+        # 根据总分生成投资建议
+        recommendation = get_recommendation(score)
+            
+        return {
+            "trend": trend,
+            "volatility": volatility,
+            "rsi": rsi,
+            "rsi_signal": rsi_signal,
+            "macd_signal": macd_signal,
+            "volume_trend": volume_trend,
+            "recent_vol": recent_vol,
+            "long_vol_avg": long_vol_avg,
+            "bband_signal": bband_signal,
+            "bband_position": bband_position,
+            "score": int(score),
+            "recommendation": recommendation
+        }
+            
+    except Exception as e:
+        print(f"分析技术指标失败: {str(e)}")
+        return {
+            "trend": "分析失败",
+            "volatility": 0,
+            "rsi": 0,
+            "rsi_signal": "未知",
+            "macd_signal": "未知",
+            "volume_trend": "未知",
+            "score": 50,
+            "recommendation": "数据不足"
+        }
+
+
+# ---------------------------------------------------------------------------
+# 组合（面板）模式：将多只股票对齐为 K线 × 股票 的二维数组，一次向量化计算全部指标
+# ---------------------------------------------------------------------------
+
+def align_panel(histories, column):
+    """将多只股票的日线某一列右对齐为二维数组
+
+    各股票按最新一根K线对齐（第 -1 行为各自最新交易日），较短的序列在顶部补NaN。
+    按K线位置而不是日历日期对齐，停牌不会在序列中间引入空洞，
+    因此每一列的计算结果与单只股票逐个计算完全一致。
+
+    Args:
+        histories: dict，股票代码 -> 日线DataFrame
+        column: 列名，如 'close'
+
+    Returns:
+        tuple: (二维数组 shape=(K线数, 股票数), 每只股票的K线数量数组)
+    """
+    symbols = list(histories)
+    lengths = np.array([len(histories[symbol]) for symbol in symbols], dtype=int)
+    rows = int(lengths.max()) if len(lengths) else 0
+    panel = np.full((rows, len(symbols)), np.nan)
+    for j, symbol in enumerate(symbols):
+        n = lengths[j]
+        if n:
+            panel[rows - n:, j] = pd.to_numeric(histories[symbol][column], errors='coerce').to_numpy(dtype=np.float64)
+    return panel, lengths
+
+
+def _rolling(values, window, reducer):
+    """沿时间轴的滚动窗口计算，窗口内有NaN或不足window时结果为NaN（与pandas rolling默认行为一致）"""
+    out = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        windows = sliding_window_view(values, window, axis=0)
+        out[window - 1:] = reducer(windows, axis=-1)
+    return out
+
+
+def _rolling_mean(values, window):
+    return _rolling(values, window, np.mean)
+
+
+def _rolling_std(values, window):
+    return _rolling(values, window, lambda w, axis: np.std(w, axis=axis, ddof=1))
+
+
+def _ewm(values, span):
+    """指数移动平均（等价于 pandas ewm(span=span, adjust=False)），从每列第一个有效值开始"""
+    alpha = 2 / (span + 1)
+    out = np.full(values.shape, np.nan)
+    prev = np.full(values.shape[1:], np.nan)
+    for t in range(len(values)):
+        x = values[t]
+        prev = np.where(np.isnan(prev), x, np.where(np.isnan(x), prev, (1 - alpha) * prev + alpha * x))
+        out[t] = prev
+    return out
+
+
+def _tail_mean(values, n):
+    """最后n行的均值，忽略NaN（与 Series.iloc[-n:].mean() 一致）"""
+    tail = values[-n:]
+    valid = ~np.isnan(tail)
+    counts = valid.sum(axis=0)
+    sums = np.where(valid, tail, 0).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def calculate_panel_indicators(close):
+    """对 K线 × 股票 的收盘价数组一次性计算全部技术指标
+
+    计算口径与 calculate_indicators 相同。
+
+    Args:
+        close: 二维收盘价数组，顶部可含NaN填充
+
+    Returns:
+        dict: 指标名 -> 与 close 同形状的二维数组
+    """
+    padded = np.isnan(close)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # RSI：差分缺失的位置按0计入（与 delta.where(delta > 0, 0) 一致），填充位置保持NaN
+        delta = np.full(close.shape, np.nan)
+        delta[1:] = close[1:] - close[:-1]
+        gain = np.where(delta > 0, delta, 0.0)
+        loss = np.where(delta < 0, -delta, 0.0)
+        gain[padded] = np.nan
+        loss[padded] = np.nan
+        rs = _rolling_mean(gain, 14) / _rolling_mean(loss, 14)
+        rsi = 100 - (100 / (1 + rs))
+
+        # MACD
+        ema12 = _ewm(close, 12)
+        ema26 = _ewm(close, 26)
+        macd = ema12 - ema26
+        signal = _ewm(macd, 9)
+
+        # MA与布林带
+        ma20 = _rolling_mean(close, 20)
+        std20 = _rolling_std(close, 20)
+
+        # 波动率
+        returns = np.full(close.shape, np.nan)
+        returns[1:] = close[1:] / close[:-1] - 1
+        volatility = _rolling_std(returns, 20) * np.sqrt(252) * 100
+
+        # 相对强度
+        low60 = _rolling(close, 60, np.min)
+        high60 = _rolling(close, 60, np.max)
+        strength = (close - low60) / (high60 - low60) * 100
+
+    return {
+        'RSI': rsi,
+        'EMA12': ema12,
+        'EMA26': ema26,
+        'MACD': macd,
+        'Signal': signal,
+        'MA5': _rolling_mean(close, 5),
+        'MA10': _rolling_mean(close, 10),
+        'MA20': ma20,
+        'MA60': _rolling_mean(close, 60),
+        'Volatility': volatility,
+        'BBand_middle': ma20,
+        'BBand_upper': ma20 + 2 * std20,
+        'BBand_lower': ma20 - 2 * std20,
+        'Strength': strength
+    }
+
+
+def score_latest(latest, count):
+    """按列向量化评分
+
+    Args:
+        latest: dict，指标名 -> 一维数组（每只股票最新一根K线的值），
+            需包含 MA5, MA20, RSI, MACD, Signal, Volatility, BBand_upper, BBand_lower,
+            close, recent_vol, long_vol_avg
+        count: 股票数量
+
+    Returns:
+        list: 每只股票的分析结果（与 analyze_indicators 的返回格式相同）
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        trend_up = latest['MA5'] > latest['MA20']
+        rsi_ok = (latest['RSI'] > 30) & (latest['RSI'] < 70)
+        macd_buy = latest['MACD'] > latest['Signal']
+        volume_up = latest['recent_vol'] > latest['long_vol_avg']
+        volatility_low = latest['Volatility'] < 30
+        bband_position = (latest['close'] - latest['BBand_lower']) / (latest['BBand_upper'] - latest['BBand_lower']) * 100
+
+    scores = 30 * trend_up + 20 * rsi_ok + 20 * macd_buy + 15 * volume_up + 15 * volatility_low
+
+    results = []
+    for j in range(count):
+        rsi = float(latest['RSI'][j])
+        position = float(bband_position[j])
+        score = int(scores[j])
+        results.append({
+            "trend": "上升" if trend_up[j] else "下降",
+            "volatility": float(latest['Volatility'][j]),
+            "rsi": rsi,
+            "rsi_signal": "超买" if rsi > 70 else "超卖" if rsi < 30 else "中性",
+            "macd_signal": "买入" if macd_buy[j] else "卖出",
+            "volume_trend": "放量" if volume_up[j] else "缩量",
+            "recent_vol": float(latest['recent_vol'][j]),
+            "long_vol_avg": float(latest['long_vol_avg'][j]),
+            "bband_signal": "超卖区" if position < 20 else "超买区" if position > 80 else "中性",
+            "bband_position": position,
+            "score": score,
+            "recommendation": get_recommendation(score)
+        })
+    return results
+
+
+def _run_panel(histories):
+    """对齐面板并计算指标，返回 (股票列表, K线数量, 收盘价, 成交量, 指标字典)"""
+    symbols = list(histories)
+    close, lengths = align_panel(histories, 'close')
+    vol, _ = align_panel(histories, 'vol')
+    return symbols, lengths, close, vol, calculate_panel_indicators(close)
+
+
+def _score_panel(symbols, lengths, close, vol, indicators, min_bars):
+    """按列向量化评分，结果与逐只调用 calculate_indicators + analyze_indicators 相同
+
+    Returns:
+        dict: 股票代码 -> 分析结果（与 analyze_indicators 的返回格式相同）
+    """
+    latest = {name: values[-1] for name, values in indicators.items()}
+    latest['close'] = close[-1]
+    latest['recent_vol'] = _tail_mean(vol, 5)
+    latest['long_vol_avg'] = _tail_mean(vol, 20)
+
+    results = {}
+    for j, result in enumerate(score_latest(latest, len(symbols))):
+        results[symbols[j]] = result if lengths[j] >= min_bars else dict(INSUFFICIENT_DATA_RESULT)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# 增量模式：每只股票持久化一份指标状态，每根新K线 O(1) 推进
+# ---------------------------------------------------------------------------
+
+class IndicatorState:
+    """单只股票的增量技术指标状态
+
+    保存 MACD/Signal 的EMA值、MA和布林带的滚动和与平方和、波动率的收益率滚动和、
+    RSI 的14日涨跌幅滚动和，以及60日最高/最低价的单调队列。
+    每根新K线只做常数次运算即可得到最新指标。
+
+    RSI 与 calculate_indicators 一致，使用14日简单平均（而非Wilder平滑），
+    因此滚动窗口类指标与批量计算结果相同；EMA类指标与从同一根K线开始的批量计算相同。
+    """
+
+    MA_WINDOWS = (5, 10, 20, 60)
+    RESYNC_EVERY = 256  # 每隔若干根K线用窗口内的原始值重算滚动和，避免浮点误差累积
+
+    def __init__(self):
+        self.last_bar = None
+        self.last_close = None
+        self.bars = 0
+        self.closes = deque(maxlen=60)
+        self.sums = {window: 0.0 for window in self.MA_WINDOWS}
+        self.sum_sq20 = 0.0
+        self.gains = deque(maxlen=14)
+        self.losses = deque(maxlen=14)
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+        self.returns = deque(maxlen=20)
+        self.return_sum = 0.0
+        self.return_sum_sq = 0.0
+        self.return_nan = 0
+        self.vols = deque(maxlen=20)
+        self.min_queue = deque()  # (K线序号, 收盘价)，收盘价单调递增
+        self.max_queue = deque()  # (K线序号, 收盘价)，收盘价单调递减
+        self.ema12 = None
+        self.ema26 = None
+        self.signal = None
+
+    def _push_window(self, close, vol):
+        """更新滚动窗口（不含EMA）"""
+        if close is None or math.isnan(close):
+            raise ValueError(f"收盘价缺失: {self.last_bar}")
+        prev = self.last_close
+
+        # RSI：首根K线的涨跌按0计入
+        delta = 0.0 if prev is None else close - prev
+        if len(self.gains) == self.gains.maxlen:
+            self.gain_sum -= self.gains[0]
+            self.loss_sum -= self.losses[0]
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        self.gains.append(gain)
+        self.losses.append(loss)
+        self.gain_sum += gain
+        self.loss_sum += loss
+
+        # MA / 布林带
+        for window in self.MA_WINDOWS:
+            if len(self.closes) >= window:
+                self.sums[window] -= self.closes[-window]
+            self.sums[window] += close
+        if len(self.closes) >= 20:
+            self.sum_sq20 -= self.closes[-20] ** 2
+        self.sum_sq20 += close ** 2
+        self.closes.append(close)
+
+        # 波动率：首根K线收益率为NaN
+        ret = float('nan') if prev is None else close / prev - 1
+        if len(self.returns) == self.returns.maxlen:
+            old = self.returns[0]
+            if math.isnan(old):
+                self.return_nan -= 1
+            else:
+                self.return_sum -= old
+                self.return_sum_sq -= old ** 2
+        self.returns.append(ret)
+        if math.isnan(ret):
+            self.return_nan += 1
+        else:
+            self.return_sum += ret
+            self.return_sum_sq += ret ** 2
+
+        # 60日最高/最低价
+        index = self.bars
+        while self.min_queue and self.min_queue[-1][1] >= close:
+            self.min_queue.pop()
+        self.min_queue.append((index, close))
+        while self.max_queue and self.max_queue[-1][1] <= close:
+            self.max_queue.pop()
+        self.max_queue.append((index, close))
+        for queue in (self.min_queue, self.max_queue):
+            if queue[0][0] <= index - 60:
+                queue.popleft()
+
+        self.vols.append(float(vol) if vol is not None else float('nan'))
+        self.last_close = close
+        self.bars += 1
+        if self.bars % self.RESYNC_EVERY == 0:
+            self._resync()
+
+    def _resync(self):
+        closes = list(self.closes)
+        for window in self.MA_WINDOWS:
+            self.sums[window] = math.fsum(closes[-window:])
+        self.sum_sq20 = math.fsum(c ** 2 for c in closes[-20:])
+        self.gain_sum = math.fsum(self.gains)
+        self.loss_sum = math.fsum(self.losses)
+        valid = [r for r in self.returns if not math.isnan(r)]
+        self.return_sum = math.fsum(valid)
+        self.return_sum_sq = math.fsum(r ** 2 for r in valid)
+
+    def advance(self, trade_date, close, vol):
+        """推进一根K线"""
+        close = float(close)
+        self._push_window(close, vol)
+        if self.ema12 is None:
+            self.ema12 = self.ema26 = close
+            self.signal = 0.0
+        else:
+            self.ema12 += (close - self.ema12) * (2 / 13)
+            self.ema26 += (close - self.ema26) * (2 / 27)
+            self.signal += (self.ema12 - self.ema26 - self.signal) * (2 / 10)
+        self.last_bar = trade_date
+
+    @classmethod
+    def from_window(cls, dates, closes, vols, ema12, ema26, signal):
+        """用最近的K线窗口和已算好的EMA值构建状态（只回放最后61根K线）
+
+        Args:
+            dates, closes, vols: 该股票从首根K线到状态所覆盖最后一根K线的序列
+            ema12, ema26, signal: 最后一根K线处的EMA值
+        """
+        state = cls()
+        count = len(closes)
+        start = max(0, count - 61)
+        if start > 0:
+            # 第61根之前的K线只作为计算涨跌幅的前收盘价
+            state.last_close = float(closes[start])
+            state.bars = start + 1
+            start += 1
+        for i in range(start, count):
+            state._push_window(float(closes[i]), vols[i])
+        state.ema12 = float(ema12)
+        state.ema26 = float(ema26)
+        state.signal = float(signal)
+        state.last_bar = dates[count - 1]
+        return state
+
+    def copy(self):
+        return IndicatorState.from_dict(self.to_dict())
+
+    def latest(self):
+        """当前最新指标值"""
+        nan = float('nan')
+        count = len(self.closes)
+        values = {f'MA{window}': self.sums[window] / window if count >= window else nan
+                  for window in self.MA_WINDOWS}
+
+        std20 = nan
+        if count >= 20:
+            std20 = math.sqrt(max(0.0, (self.sum_sq20 - self.sums[20] ** 2 / 20) / 19))
+        values['BBand_middle'] = values['MA20']
+        values['BBand_upper'] = values['MA20'] + 2 * std20
+        values['BBand_lower'] = values['MA20'] - 2 * std20
+
+        rsi = nan
+        if len(self.gains) == 14:
+            gain = max(0.0, self.gain_sum) / 14
+            loss = max(0.0, self.loss_sum) / 14
+            if loss < 1e-12:
+                rsi = nan if gain < 1e-12 else 100.0
+            else:
+                rsi = 100 - 100 / (1 + gain / loss)
+        values['RSI'] = rsi
+
+        volatility = nan
+        if len(self.returns) == 20 and self.return_nan == 0:
+            variance = (self.return_sum_sq - self.return_sum ** 2 / 20) / 19
+            volatility = math.sqrt(max(0.0, variance)) * math.sqrt(252) * 100
+        values['Volatility'] = volatility
+
+        strength = nan
+        if self.bars >= 60:
+            low = self.min_queue[0][1]
+            high = self.max_queue[0][1]
+            if high > low:
+                strength = (self.last_close - low) / (high - low) * 100
+        values['Strength'] = strength
+
+        macd = self.ema12 - self.ema26 if self.ema12 is not None else nan
+        values['MACD'] = macd
+        values['Signal'] = self.signal if self.signal is not None else nan
+        values['close'] = self.last_close if self.last_close is not None else nan
+
+        vols = [v for v in self.vols if not math.isnan(v)]
+        recent = [v for v in list(self.vols)[-5:] if not math.isnan(v)]
+        values['recent_vol'] = sum(recent) / len(recent) if recent else nan
+        values['long_vol_avg'] = sum(vols) / len(vols) if vols else nan
+        return values
+
+    def analyze(self):
+        """按最新指标评分，返回格式与 analyze_indicators 相同"""
+        latest = {name: np.array([value]) for name, value in self.latest().items()}
+        return score_latest(latest, 1)[0]
+
+    def to_dict(self):
+        return {
+            'last_bar': self.last_bar,
+            'last_close': self.last_close,
+            'bars': self.bars,
+            'closes': list(self.closes),
+            'sums': {str(window): total for window, total in self.sums.items()},
+            'sum_sq20': self.sum_sq20,
+            'gains': list(self.gains),
+            'losses': list(self.losses),
+            'gain_sum': self.gain_sum,
+            'loss_sum': self.loss_sum,
+            'returns': list(self.returns),
+            'return_sum': self.return_sum,
+            'return_sum_sq': self.return_sum_sq,
+            'return_nan': self.return_nan,
+            'vols': list(self.vols),
+            'min_queue': list(self.min_queue),
+            'max_queue': list(self.max_queue),
+            'ema12': self.ema12,
+            'ema26': self.ema26,
+            'signal': self.signal
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls()
+        state.last_bar = data['last_bar']
+        state.last_close = data['last_close']
+        state.bars = data['bars']
+        state.closes.extend(data['closes'])
+        state.sums = {int(window): total for window, total in data['sums'].items()}
+        state.sum_sq20 = data['sum_sq20']
+        state.gains.extend(data['gains'])
+        state.losses.extend(data['losses'])
+        state.gain_sum = data['gain_sum']
+        state.loss_sum = data['loss_sum']
+        state.returns.extend(data['returns'])
+        state.return_sum = data['return_sum']
+        state.return_sum_sq = data['return_sum_sq']
+        state.return_nan = data['return_nan']
+        state.vols.extend(data['vols'])
+        state.min_queue.extend(tuple(item) for item in data['min_queue'])
+        state.max_queue.extend(tuple(item) for item in data['max_queue'])
+        state.ema12 = data['ema12']
+        state.ema26 = data['ema26']
+        state.signal = data['signal']
+        return state
+
+    def dumps(self):
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def loads(cls, text):
+        return cls.from_dict(json.loads(text))
+
+
+def analyze_incremental(histories, states, min_bars=20):
+    """增量优先的组合评分
+
+    持久化状态只覆盖已收盘的K线（即每只股票的倒数第二根及之前），
+    盘中不断变化的最后一根K线在状态副本上推进一次得到最新指标，不会污染状态。
+    状态缺失、与日线不一致（如前复权基准变化）的股票回退到面板批量计算，并用其结果重建状态。
+
+    Args:
+        histories: dict，股票代码 -> 日线DataFrame
+        states: dict，股票代码 -> IndicatorState（已持久化的状态）
+        min_bars: 参与评分所需的最少K线数量
+
+    Returns:
+        tuple: (股票代码 -> 分析结果, 股票代码 -> 需要保存的 IndicatorState)
+    """
+    analyses = {}
+    updated = {}
+    cold = {}
+    for symbol, df in histories.items():
+        if df is None or len(df) == 0:
+            continue
+        state = states.get(symbol)
+        if state is not None and len(df) >= 2:
+            dates = df['trade_date'].tolist()
+            closes = pd.to_numeric(df['close'], errors='coerce').tolist()
+            vols = pd.to_numeric(df['vol'], errors='coerce').tolist()
+            k = bisect.bisect_left(dates, state.last_bar)
+            # 状态的最后一根K线必须仍在窗口内、不是最新K线，且收盘价未因复权变化
+            if k < len(dates) - 1 and dates[k] == state.last_bar and closes[k] == state.last_close:
+                try:
+                    advanced = k < len(dates) - 2
+                    for i in range(k + 1, len(dates) - 1):
+                        state.advance(dates[i], closes[i], vols[i])
+                    current = state.copy()
+                    current.advance(dates[-1], closes[-1], vols[-1])
+                    analyses[symbol] = current.analyze() if len(df) >= min_bars else dict(INSUFFICIENT_DATA_RESULT)
+                    if advanced:
+                        updated[symbol] = state
+                    continue
+                except ValueError:
+                    pass
+        cold[symbol] = df
+
+    if cold:
+        symbols, lengths, close, vol, indicators = _run_panel(cold)
+        analyses.update(_score_panel(symbols, lengths, close, vol, indicators, min_bars))
+        rows = len(close)
+        for j, symbol in enumerate(symbols):
+            n = lengths[j]
+            if n < 2:
+                continue
+            # 用面板结果在倒数第二根K线处建立状态
+            seed_closes = close[rows - n:rows - 1, j]
+            if np.isnan(seed_closes).any():
+                continue
+            updated[symbol] = IndicatorState.from_window(
+                cold[symbol]['trade_date'].tolist()[:-1],
+                seed_closes,
+                vol[rows - n:rows - 1, j],
+                indicators['EMA12'][rows - 2, j],
+                indicators['EMA26'][rows - 2, j],
+                indicators['Signal'][rows - 2, j]
+            )
+    return analyses, updated
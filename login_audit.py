@@ -0,0 +1,220 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+from sqlalchemy import bindparam
+from models import db, User, LoginLog
+import login_stats
+
+logger = logging.getLogger(__name__)
+
+# 持久性模式：buffered 由后台线程批量写入，进程崩溃时最多丢失一个刷新间隔内的记录；
+# sync 在请求内写入并提交，与原来的行为一致
+DURABILITY_BUFFERED = 'buffered'
+DURABILITY_SYNC = 'sync'
+
+
+def write_login_events(events):
+    """在一个事务中写入一批登录事件
+
+    批量插入登录日志，累加登录汇总，并用每个用户最近一次成功登录更新最后登录信息。
+    批量插入不会触发 LoginLog 的 after_insert 事件，因此在这里显式累加汇总。
+    已被删除的用户的事件直接丢弃。
+
+    Args:
+        events: dict列表，包含 user_id, ip_address, user_agent, status, login_time
+    """
+    user_ids = {event['user_id'] for event in events}
+    existing = {user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(user_ids))}
+    events = [event for event in events if event['user_id'] in existing]
+    if not events:
+        return
+
+    db.session.execute(LoginLog.__table__.insert(), events)
+    login_stats.add_rollups(db.session.connection(), events)
+
+    latest = {}
+    for event in events:
+        if event['status'] == 'success':
+            current = latest.get(event['user_id'])
+            if current is None or event['login_time'] >= current['login_time']:
+                latest[event['user_id']] = event
+    if latest:
+        table = User.__table__
+        db.session.execute(
+            table.update().where(table.c.id == bindparam('uid')).values(
+                last_login_at=bindparam('login_time'),
+                last_login_ip=bindparam('ip_address')
+            ),
+            [{'uid': user_id, 'login_time': event['login_time'], 'ip_address': event['ip_address']}
+             for user_id, event in latest.items()]
+        )
+    db.session.commit()
+
+
+class LoginAuditWriter:
+    """登录审计记录的后写缓冲
+
+    登录请求只把事件放入有界队列，由后台线程按批次在一个事务中写入，
+    登录响应不再等待SQLite的写锁。队列已满时退回到在调用线程中同步写入。
+    写入失败（如 database is locked）时回滚并按指数退避重试，仍失败时逐条写入，
+    写不进去的事件留在重试列表中稍后再写，不丢弃记录。进程退出时写完所有剩余事件。
+    """
+
+    def __init__(self, app, durability=DURABILITY_BUFFERED, max_queue=10000, batch_size=500, flush_interval=0.5,
+                 retries=3, backoff=0.1, max_backoff=2.0):
+        """
+        Args:
+            app: Flask应用，后台线程在其应用上下文中写入
+            durability: DURABILITY_BUFFERED 或 DURABILITY_SYNC
+            max_queue: 队列容量
+            batch_size: 每个事务最多写入的事件数
+            flush_interval: 后台线程的最长等待时间（秒），即缓冲模式下记录的最大延迟
+            retries: 一批事件写入失败后的重试次数
+            backoff: 首次重试前的等待时间（秒），之后每次翻倍
+            max_backoff: 单次等待的上限（秒）
+        """
+        if durability not in (DURABILITY_BUFFERED, DURABILITY_SYNC):
+            raise ValueError(f"不支持的持久性模式: {durability}")
+        self.app = app
+        self.durability = durability
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._queue = queue.Queue(maxsize=max_queue)
+        # 重试后仍未写入的事件，下一批优先写入
+        self._retry = []
+        self._retry_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # 进程退出时写完剩余事件；只注册一次，线程重启不会重复注册
+        atexit.register(self.stop)
+
+    def start(self):
+        """启动后台写入线程（重复调用无副作用）"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='login-audit-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """停止后台线程并写完队列中剩余的事件"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        # 线程未启动或未能按时结束时，在当前线程逐批写完剩余事件
+        while True:
+            events = self._drain()
+            if not events:
+                break
+            if not self._flush(events):
+                logger.error(f"退出时仍有 {self.pending} 条登录审计记录无法写入")
+                break
+
+    def record(self, user_id, ip_address, user_agent, status, login_time):
+        """记录一次登录事件"""
+        event = {
+            'user_id': user_id,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'status': status,
+            'login_time': login_time
+        }
+        if self.durability == DURABILITY_SYNC:
+            if not self._flush([event]):
+                # 重试后仍失败，交给后台线程稍后写入
+                self.start()
+            return
+        self.start()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            logger.warning("登录审计队列已满，改为同步写入")
+            self._flush([event])
+
+    @property
+    def pending(self):
+        """队列和重试列表中尚未写入的事件数"""
+        return self._queue.qsize() + len(self._retry)
+
+    def _drain(self, first=None):
+        """取出待写入的事件，最多 batch_size 个，重试列表中的事件优先"""
+        with self._retry_lock:
+            events = self._retry[:self.batch_size]
+            del self._retry[:self.batch_size]
+        if first is not None:
+            events.append(first)
+        while len(events) < self.batch_size:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _write(self, events, retries):
+        """在一个事务中写入事件，失败时回滚并按指数退避重试
+
+        Returns:
+            bool: 是否写入成功
+        """
+        delay = self.backoff
+        for attempt in range(retries + 1):
+            try:
+                with self.app.app_context():
+                    try:
+                        write_login_events(events)
+                    except Exception:
+                        db.session.rollback()
+                        raise
+                return True
+            except Exception as e:
+                if attempt == retries:
+                    logger.warning(f"写入 {len(events)} 条登录审计记录失败: {str(e)}")
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    def _flush(self, events):
+        """写入一批事件；整批重试后仍失败时逐条写入，写不进去的事件放回重试列表
+
+        Returns:
+            bool: 是否全部写入
+        """
+        if not events or self._write(events, self.retries):
+            return True
+        failed = [event for event in events if not self._write([event], 0)]
+        if failed:
+            with self._retry_lock:
+                self._retry[:0] = failed
+            logger.error(f"{len(failed)} 条登录审计记录暂时无法写入，稍后重试")
+        return not failed
+
+    def _run(self):
+        delay = self.flush_interval
+        while not self._stop.is_set():
+            if self._retry:
+                # 有待重试的事件时不等待新事件，但按退避间隔重试
+                if self._stop.wait(delay):
+                    break
+                events = self._drain()
+            else:
+                try:
+                    first = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                events = self._drain(first)
+            if self._flush(events):
+                delay = self.flush_interval
+            else:
+                delay = min(delay * 2, self.max_backoff)
+        while True:
+            events = self._drain()
+            if not events or not self._flush(events):
+                break
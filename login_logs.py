@@ -0,0 +1,158 @@
+import csv
+import io
+import base64
+from datetime import datetime, timedelta
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload
+from models import db, User, LoginLog
+
+# 每页显示的登录日志条数
+PAGE_SIZE = 20
+
+# 导出时每批读取的行数
+EXPORT_BATCH_SIZE = 1000
+
+# 导出CSV的列：(表头, 列)
+EXPORT_COLUMNS = [
+    ('ID', LoginLog.id),
+    ('用户名', User.username),
+    ('IP地址', LoginLog.ip_address),
+    ('登录时间', LoginLog.login_time),
+    ('状态', LoginLog.status),
+    ('浏览器', LoginLog.user_agent),
+]
+
+# 支持的筛选参数
+FILTER_KEYS = ('username', 'status', 'ip', 'start', 'end')
+
+
+def parse_filters(args):
+    """从请求参数中取出有效的筛选条件
+
+    Returns:
+        dict: 只包含非空且格式正确的筛选条件，可直接用于生成链接
+    """
+    filters = {}
+    for key in FILTER_KEYS:
+        value = (args.get(key) or '').strip()
+        if not value:
+            continue
+        if key == 'status' and value not in ('success', 'failed'):
+            continue
+        if key in ('start', 'end'):
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                continue
+        filters[key] = value
+    return filters
+
+
+def _apply_filters(query, filters):
+    if 'username' in filters:
+        query = query.filter(LoginLog.user_id.in_(
+            db.session.query(User.id).filter(User.username == filters['username'])
+        ))
+    if 'status' in filters:
+        query = query.filter(LoginLog.status == filters['status'])
+    if 'ip' in filters:
+        query = query.filter(LoginLog.ip_address == filters['ip'])
+    if 'start' in filters:
+        query = query.filter(LoginLog.login_time >= datetime.strptime(filters['start'], '%Y-%m-%d'))
+    if 'end' in filters:
+        query = query.filter(LoginLog.login_time < datetime.strptime(filters['end'], '%Y-%m-%d') + timedelta(days=1))
+    return query
+
+
+def encode_cursor(log):
+    """用 (login_time, id) 生成分页游标"""
+    text = f"{log.login_time.isoformat()}|{log.id}"
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """解析分页游标，无效时返回None"""
+    if not cursor:
+        return None
+    try:
+        login_time, log_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return datetime.fromisoformat(login_time), int(log_id)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def fetch_page(filters, after=None, before=None, per_page=PAGE_SIZE):
+    """按 (login_time, id) 倒序的游标分页，不统计总数
+
+    Args:
+        filters: parse_filters 的结果
+        after: 游标，返回比它更早的一页
+        before: 游标，返回比它更新的一页
+        per_page: 每页条数
+
+    Returns:
+        dict: {'items', 'next_cursor', 'prev_cursor'}，没有下一页/上一页时游标为None
+    """
+    key = tuple_(LoginLog.login_time, LoginLog.id)
+    query = _apply_filters(LoginLog.query.options(joinedload(LoginLog.user)), filters)
+    after = decode_cursor(after)
+    before = decode_cursor(before) if after is None else None
+
+    if before is not None:
+        rows = query.filter(key > before).order_by(
+            LoginLog.login_time.asc(), LoginLog.id.asc()
+        ).limit(per_page + 1).all()
+        has_newer = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_older = True
+    else:
+        if after is not None:
+            query = query.filter(key < after)
+        rows = query.order_by(LoginLog.login_time.desc(), LoginLog.id.desc()).limit(per_page + 1).all()
+        has_older = len(rows) > per_page
+        items = rows[:per_page]
+        has_newer = after is not None
+
+    return {
+        'items': items,
+        'next_cursor': encode_cursor(items[-1]) if items and has_older else None,
+        'prev_cursor': encode_cursor(items[0]) if items and has_newer else None
+    }
+
+
+def iter_csv(filters, batch_size=EXPORT_BATCH_SIZE):
+    """逐批生成筛选后登录日志的CSV内容
+
+    按游标分批查询，每批只保留当前批次的行，内存占用与总行数无关。
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM，便于Excel识别UTF-8
+    buffer.write('\ufeff')
+    writer.writerow([title for title, _ in EXPORT_COLUMNS])
+    yield buffer.getvalue()
+
+    key = tuple_(LoginLog.login_time, LoginLog.id)
+    query = _apply_filters(
+        db.session.query(*[column for _, column in EXPORT_COLUMNS]).outerjoin(User, User.id == LoginLog.user_id),
+        filters
+    )
+    cursor = None
+    while True:
+        batch_query = query if cursor is None else query.filter(key < cursor)
+        rows = batch_query.order_by(LoginLog.login_time.desc(), LoginLog.id.desc()).limit(batch_size).all()
+        if not rows:
+            break
+        buffer.seek(0)
+        buffer.truncate()
+        for log_id, username, ip_address, login_time, status, user_agent in rows:
+            writer.writerow([
+                log_id, username, ip_address,
+                login_time.strftime('%Y-%m-%d %H:%M:%S') if login_time else '',
+                status, user_agent
+            ])
+        yield buffer.getvalue()
+        last = rows[-1]
+        cursor = (last[3], last[0])
+        # 结束读事务，避免长时间导出阻塞SQLite的写入检查点
+        db.session.commit()
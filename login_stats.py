@@ -0,0 +1,184 @@
+import os
+import csv
+import gzip
+import logging
+from collections import Counter
+from datetime import date, timedelta
+from sqlalchemy import event, func
+from sqlalchemy.dialects.sqlite import insert
+from models import db, User, UserPortfolio, LoginLog, LoginDailyStat, UserLoginStat, get_beijing_time
+
+logger = logging.getLogger(__name__)
+
+# 用户管理页面每页显示的用户数
+USERS_PER_PAGE = 50
+
+# 归档文件中登录日志的列
+ARCHIVE_COLUMNS = ('id', 'user_id', 'login_time', 'ip_address', 'user_agent', 'status')
+
+
+def _increment(connection, model, key, amount=1):
+    """汇总行计数加amount，不存在时插入"""
+    statement = insert(model.__table__).values(count=amount, **key)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=list(key),
+        set_={'count': model.__table__.c.count + amount}
+    ))
+
+
+@event.listens_for(LoginLog, 'after_insert')
+def _rollup_login(mapper, connection, target):
+    """写入登录日志时，在同一事务中累加按天和按用户的汇总"""
+    day = (target.login_time or get_beijing_time()).date()
+    status = target.status or 'success'
+    _increment(connection, LoginDailyStat, {'day': day, 'status': status})
+    _increment(connection, UserLoginStat, {'user_id': target.user_id, 'day': day, 'status': status})
+
+
+def add_rollups(connection, logs):
+    """批量插入登录日志（不经过ORM，不触发 after_insert）后，按批次累加汇总
+
+    Args:
+        connection: 与插入登录日志相同事务的连接
+        logs: dict列表，包含 user_id, login_time, status
+    """
+    daily = Counter()
+    per_user = Counter()
+    for log in logs:
+        day = (log.get('login_time') or get_beijing_time()).date()
+        status = log.get('status') or 'success'
+        daily[(day, status)] += 1
+        per_user[(log['user_id'], day, status)] += 1
+    for (day, status), count in daily.items():
+        _increment(connection, LoginDailyStat, {'day': day, 'status': status}, count)
+    for (user_id, day, status), count in per_user.items():
+        _increment(connection, UserLoginStat, {'user_id': user_id, 'day': day, 'status': status}, count)
+
+
+def user_counts():
+    """用户总数、活跃用户数和管理员数，一次查询"""
+    total, active, admins = db.session.query(
+        func.count(User.id),
+        func.coalesce(func.sum(db.case([(User.is_active, 1)], else_=0)), 0),
+        func.coalesce(func.sum(db.case([(User.is_admin, 1)], else_=0)), 0)
+    ).one()
+    return {'users_count': total, 'active_users_count': active, 'admins_count': admins}
+
+
+def login_totals():
+    """各状态的累计登录次数，从按天汇总中读取
+
+    Returns:
+        dict: 状态 -> 次数
+    """
+    rows = db.session.query(LoginDailyStat.status, func.sum(LoginDailyStat.count)).group_by(LoginDailyStat.status).all()
+    return {status: int(count or 0) for status, count in rows}
+
+
+def paginate_users(page, per_page=USERS_PER_PAGE):
+    """分页查询用户及其持仓数、失败登录次数
+
+    持仓数和失败登录次数分别按用户分组后与用户表外连接，整页只需一次查询（另加一次分页计数），
+    与用户数量无关。最后登录时间直接取自 User.last_login_at。
+
+    Returns:
+        Pagination: items 为 (User, 持仓数, 失败登录次数) 元组
+    """
+    holdings = db.session.query(
+        UserPortfolio.user_id.label('user_id'), func.count(UserPortfolio.id).label('count')
+    ).group_by(UserPortfolio.user_id).subquery()
+    failed = db.session.query(
+        UserLoginStat.user_id.label('user_id'), func.sum(UserLoginStat.count).label('count')
+    ).filter(UserLoginStat.status == 'failed').group_by(UserLoginStat.user_id).subquery()
+    query = db.session.query(
+        User,
+        func.coalesce(holdings.c.count, 0),
+        func.coalesce(failed.c.count, 0)
+    ).outerjoin(holdings, holdings.c.user_id == User.id).outerjoin(
+        failed, failed.c.user_id == User.id
+    ).order_by(User.id)
+    return query.paginate(page=page, per_page=per_page, error_out=False)
+
+
+def ensure_rollups():
+    """汇总表为空而登录日志不为空时（升级前的数据），从登录日志重建汇总
+
+    登录日志被压缩后不能再据此重建，因此只在汇总表为空时执行。
+    """
+    if db.session.query(LoginDailyStat.day).first() is not None:
+        return
+    if db.session.query(LoginLog.id).first() is None:
+        return
+    day = func.date(LoginLog.login_time)
+    daily = db.session.query(day, LoginLog.status, func.count()).group_by(day, LoginLog.status).all()
+    per_user = db.session.query(LoginLog.user_id, day, LoginLog.status, func.count()).group_by(
+        LoginLog.user_id, day, LoginLog.status
+    ).all()
+    db.session.execute(insert(LoginDailyStat.__table__), [
+        {'day': _parse_day(value), 'status': status or 'success', 'count': count}
+        for value, status, count in daily
+    ])
+    db.session.execute(insert(UserLoginStat.__table__), [
+        {'user_id': user_id, 'day': _parse_day(value), 'status': status or 'success', 'count': count}
+        for user_id, value, status, count in per_user
+    ])
+    db.session.commit()
+    logger.info(f"已从登录日志重建登录汇总：{len(daily)} 条按天汇总，{len(per_user)} 条按用户汇总")
+
+
+def _parse_day(value):
+    """SQLite的 date() 返回字符串"""
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def remove_user_stats(user_id):
+    """删除用户前，从按天汇总中扣除该用户的登录次数，与删除登录日志的效果一致"""
+    rows = UserLoginStat.query.filter_by(user_id=user_id).all()
+    connection = db.session.connection()
+    for row in rows:
+        _increment(connection, LoginDailyStat, {'day': row.day, 'status': row.status}, -row.count)
+
+
+def compact_login_logs(retention_days, archive_dir=None, batch_size=5000):
+    """删除超过保留天数的原始登录日志，汇总数据不受影响
+
+    Args:
+        retention_days: 原始日志保留天数
+        archive_dir: 归档目录，指定时先把要删除的日志写入 gzip 压缩的CSV文件
+        batch_size: 每个事务删除的行数，避免长时间占用写锁
+
+    Returns:
+        int: 删除的行数
+    """
+    cutoff = (get_beijing_time() - timedelta(days=retention_days)).replace(tzinfo=None)
+    path = None
+    archive = None
+    writer = None
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+        path = os.path.join(archive_dir, f"login_log_before_{cutoff.strftime('%Y%m%d')}_{get_beijing_time().strftime('%Y%m%d%H%M%S')}.csv.gz")
+        archive = gzip.open(path, 'wt', encoding='utf-8', newline='')
+        writer = csv.writer(archive)
+        writer.writerow(ARCHIVE_COLUMNS)
+
+    deleted = 0
+    try:
+        while True:
+            rows = db.session.query(*[getattr(LoginLog, column) for column in ARCHIVE_COLUMNS]).filter(
+                LoginLog.login_time < cutoff
+            ).order_by(LoginLog.id).limit(batch_size).all()
+            if not rows:
+                break
+            if writer is not None:
+                writer.writerows(rows)
+            ids = [row[0] for row in rows]
+            LoginLog.query.filter(LoginLog.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            deleted += len(ids)
+    finally:
+        if archive is not None:
+            archive.close()
+            if deleted == 0:
+                os.remove(path)
+    logger.info(f"已压缩 {cutoff} 之前的登录日志 {deleted} 条")
+    return deleted
@@ -0,0 +1,439 @@
+import time
+import json
+import struct
+import threading
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 快照序列化格式：魔数 + 头部长度(uint32) + JSON头部，随后为按 SNAPSHOT_ALIGN 对齐的各列原始数据
+SNAPSHOT_MAGIC = b'MKS1'
+SNAPSHOT_ALIGN = 64
+SNAPSHOT_COLUMNS = ('codes', 'names', 'industries', 'price', 'change_pct', 'change_amount', 'volume', 'turnover')
+
+
+def _float_column(df, column):
+    """将行情列转换为float64数组，缺失列返回全0数组"""
+    if column not in df.columns:
+        return np.zeros(len(df), dtype=np.float64)
+    return pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+
+
+class MarketSnapshot:
+    """A股实时行情快照
+
+    由 ak.stock_zh_a_spot_em() 的结果构建一次，之后按股票代码 O(1) 查询行情，
+    避免每只股票都对约5000行的DataFrame做一次布尔掩码扫描。
+    价格、涨跌幅、成交量、换手率等以NumPy数组按列存储，不保留原始DataFrame。
+    首页涨跌幅榜、行业汇总和自选股行情都从同一份快照派生，version 随每次刷新递增。
+    """
+
+    def __init__(self, df, timestamp=None, version=0):
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.version = version
+        self.codes = df['代码'].astype(str).to_numpy()
+        self.names = df['名称'].astype(str).to_numpy()
+        if '所属行业' in df.columns:
+            self.industries = df['所属行业'].fillna('').astype(str).to_numpy()
+        else:
+            self.industries = None
+
+        self.price = _float_column(df, '最新价')
+        self.change_pct = _float_column(df, '涨跌幅')
+        self.change_amount = _float_column(df, '涨跌额')
+        self.volume = _float_column(df, '成交量')
+        self.turnover = _float_column(df, '换手率')
+
+        self._build_index()
+
+    def _build_index(self):
+        # 代码 -> 行号索引，重复代码保留第一条（与原先 iloc[0] 行为一致）
+        self.index = {}
+        for i, code in enumerate(self.codes.tolist()):
+            self.index.setdefault(code, i)
+
+    def to_bytes(self):
+        """序列化为可被多个进程mmap共享的字节串
+
+        字符串列转换为定长Unicode数组，数值列保持float64，均为原始内存布局。
+        """
+        arrays = {}
+        for name in SNAPSHOT_COLUMNS:
+            values = getattr(self, name)
+            if values is None:
+                continue
+            if values.dtype.kind in ('O', 'U'):
+                values = values.astype(str)
+            arrays[name] = np.ascontiguousarray(values)
+
+        columns = []
+        offset = 0
+        for name, values in arrays.items():
+            offset = -(-offset // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+            columns.append([name, values.dtype.str, len(values), offset])
+            offset += values.nbytes
+        header = json.dumps({
+            'timestamp': self.timestamp,
+            'version': self.version,
+            'columns': columns
+        }).encode('utf-8')
+        data_start = -(-(len(SNAPSHOT_MAGIC) + 4 + len(header)) // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+
+        buffer = bytearray(data_start + offset)
+        buffer[:len(SNAPSHOT_MAGIC)] = SNAPSHOT_MAGIC
+        struct.pack_into('<I', buffer, len(SNAPSHOT_MAGIC), len(header))
+        buffer[len(SNAPSHOT_MAGIC) + 4:len(SNAPSHOT_MAGIC) + 4 + len(header)] = header
+        for (name, _, _, column_offset), values in zip(columns, arrays.values()):
+            start = data_start + column_offset
+            buffer[start:start + values.nbytes] = values.tobytes()
+        return bytes(buffer)
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """从 to_bytes 的结果（bytes或mmap）重建快照
+
+        各列是指向buffer的只读NumPy视图，不复制数据；只有代码索引在每个进程中重建。
+
+        Raises:
+            ValueError: 不是快照格式
+        """
+        view = memoryview(buffer)
+        if bytes(view[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+            raise ValueError("无效的行情快照数据")
+        header_length, = struct.unpack_from('<I', view, len(SNAPSHOT_MAGIC))
+        header_start = len(SNAPSHOT_MAGIC) + 4
+        header = json.loads(bytes(view[header_start:header_start + header_length]).decode('utf-8'))
+        data_start = -(-(header_start + header_length) // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+
+        snapshot = cls.__new__(cls)
+        snapshot.timestamp = header['timestamp']
+        snapshot.version = header['version']
+        snapshot.industries = None
+        for name, dtype, length, offset in header['columns']:
+            setattr(snapshot, name, np.frombuffer(buffer, dtype=np.dtype(dtype), count=length, offset=data_start + offset))
+        snapshot._build_index()
+        return snapshot
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def get_quote(self, code):
+        """按股票代码获取行情
+
+        Args:
+            code: 股票代码，如 '600519'
+
+        Returns:
+            dict: 行情数据，未找到时返回None
+        """
+        i = self.index.get(code)
+        if i is None:
+            return None
+        return {
+            "symbol": code,
+            "name": str(self.names[i]),
+            "industry": str(self.industries[i]) if self.industries is not None else "",
+            "current_price": float(self.price[i]),
+            "change_pct": float(self.change_pct[i]),
+            "change_amount": float(self.change_amount[i]),
+            "volume": float(self.volume[i]),
+            "turnover": float(self.turnover[i]),
+        }
+
+    def _ranked(self, n, descending):
+        """按涨跌幅排序取前n只股票的行号，忽略涨跌幅缺失的股票"""
+        valid = np.flatnonzero(~np.isnan(self.change_pct))
+        if len(valid) == 0:
+            return []
+        values = self.change_pct[valid]
+        if descending:
+            values = -values
+        n = min(n, len(valid))
+        top = np.argpartition(values, n - 1)[:n]
+        top = top[np.argsort(values[top], kind='stable')]
+        return valid[top]
+
+    def _rank_entries(self, rows):
+        return [{
+            'name': str(self.names[i]),
+            'price': float(self.price[i]),
+            'change_pct': float(self.change_pct[i])
+        } for i in rows]
+
+    def top_gainers(self, n=5):
+        """涨幅榜前n名"""
+        return self._rank_entries(self._ranked(n, descending=True))
+
+    def top_losers(self, n=5):
+        """跌幅榜前n名"""
+        return self._rank_entries(self._ranked(n, descending=False))
+
+    def industry_summary(self, n=5):
+        """按所属行业汇总平均涨跌幅，取涨幅前n的行业
+
+        行情数据不含行业字段时返回空列表。
+        """
+        if self.industries is None:
+            return []
+        valid = (self.industries != '') & ~np.isnan(self.change_pct)
+        if not valid.any():
+            return []
+        labels, inverse = np.unique(self.industries[valid], return_inverse=True)
+        sums = np.bincount(inverse, weights=self.change_pct[valid])
+        counts = np.bincount(inverse)
+        means = sums / counts
+        order = np.argsort(-means, kind='stable')[:n]
+        return [{'name': str(labels[i]), 'change_pct': float(means[i])} for i in order]
+
+    def get_quotes(self, codes):
+        """批量获取行情
+
+        Args:
+            codes: 股票代码列表
+
+        Returns:
+            dict: 股票代码 -> 行情数据，未找到的代码不包含在结果中
+        """
+        quotes = {}
+        for code in codes:
+            quote = self.get_quote(code)
+            if quote is not None:
+                quotes[code] = quote
+        return quotes
+
+
+class SnapshotRefresher:
+    """后台行情刷新器（stale-while-revalidate + single-flight）
+
+    后台线程按固定间隔重建行情快照；刷新进行中时继续返回上一版本快照，
+    并保证同一时刻只有一个上游请求在执行，避免并发请求同时访问上游接口。
+    """
+
+    def __init__(self, fetch, interval=60, max_age=600, store=None, key='market_snapshot'):
+        """
+        Args:
+            fetch: 获取行情DataFrame的函数，如 ak.stock_zh_a_spot_em
+            interval: 后台刷新间隔（秒）
+            max_age: 快照超过该时长（秒）视为过期，读取时会触发一次后台刷新
+            store: 共享存储（shared_cache.FileStore 等），多个工作进程共用一份快照，
+                只有获得刷新锁的进程请求上游；None表示每个进程独立刷新
+            key: 快照在共享存储中的key
+        """
+        self._fetch = fetch
+        self.interval = interval
+        self.max_age = max_age
+        self._store = store
+        self.key = key
+        self._shared_stamp = None
+        self._load_lock = threading.Lock()
+        self._failed = False
+        self._fetches = 0
+        self._failures = 0
+        self._shared_loads = 0
+        self._snapshot = None
+        self._version = 0
+        self._refresh_lock = threading.Lock()
+        self._attempts = 0
+        self._attempt_done = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动后台刷新线程（重复调用无副作用）"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='market-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """停止后台刷新线程"""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh(block=False, force=False)
+            self._stop.wait(self._next_wait())
+
+    def _next_wait(self):
+        """共享存储模式下在当前快照到期时醒来，由最先醒来的进程负责刷新，其余进程随后载入结果"""
+        snapshot = self._snapshot
+        if self._store is None or snapshot is None or self._failed:
+            return self.interval
+        return min(self.interval, max(1.0, self.interval - (time.time() - snapshot.timestamp)))
+
+    def _load_shared(self):
+        """共享存储中有比当前更新的快照时载入
+
+        Returns:
+            bool: 是否载入了新快照
+        """
+        if self._store is None:
+            return False
+        stamp = self._store.stamp(self.key)
+        if stamp is None or stamp == self._shared_stamp:
+            return False
+        if not self._load_lock.acquire(blocking=False):
+            return False
+        try:
+            buffer = self._store.get(self.key)
+            if buffer is None:
+                return False
+            try:
+                snapshot = MarketSnapshot.from_buffer(buffer)
+            except ValueError as e:
+                logger.error(f"载入共享行情快照失败: {str(e)}")
+                return False
+            self._shared_stamp = stamp
+            if snapshot.version <= self._version:
+                return False
+            self._snapshot = snapshot
+            self._version = snapshot.version
+            self._failed = False
+            self._shared_loads += 1
+        finally:
+            self._load_lock.release()
+        with self._attempt_done:
+            self._attempt_done.notify_all()
+        return True
+
+    def _is_fresh(self):
+        snapshot = self._snapshot
+        return snapshot is not None and time.time() - snapshot.timestamp < self.interval
+
+    def _fetch_snapshot(self):
+        started = time.time()
+        self._fetches += 1
+        snapshot = MarketSnapshot(self._fetch(), timestamp=started, version=self._version + 1)
+        self._version = snapshot.version
+        self._snapshot = snapshot
+        logger.info(f"更新市场数据缓存（版本 {snapshot.version}），耗时 {time.time() - started:.2f} 秒")
+        return snapshot
+
+    def _refresh_shared(self, block, force):
+        """共享存储模式的刷新：优先载入其他进程的结果，只有获得刷新锁的进程请求上游"""
+        self._load_shared()
+        if not force and self._is_fresh():
+            return
+        version = self._version
+        with self._store.lock(self.key, blocking=block) as acquired:
+            if not acquired:
+                # 其他进程正在刷新，继续使用当前快照
+                return
+            # 等锁期间其他进程可能已完成刷新，直接使用其结果
+            self._load_shared()
+            if self._version > version or (not force and self._is_fresh()):
+                return
+            snapshot = self._fetch_snapshot()
+            self._store.set(self.key, snapshot.to_bytes())
+            self._shared_stamp = self._store.stamp(self.key)
+
+    def refresh(self, block=True, force=True):
+        """刷新行情快照，同一时刻只允许一个刷新在执行
+
+        Args:
+            block: 已有刷新在执行时，是否等待其完成
+            force: 共享存储模式下，快照未到刷新间隔时是否仍然请求上游（后台定时刷新为False）
+
+        Returns:
+            MarketSnapshot: 当前快照，可能为None
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            if block:
+                # 等待正在执行的刷新完成，复用其结果而不是再请求一次上游
+                with self._refresh_lock:
+                    pass
+            return self._snapshot
+
+        try:
+            if self._store is None:
+                self._fetch_snapshot()
+            else:
+                self._refresh_shared(block, force)
+            self._failed = False
+        except Exception as e:
+            logger.error(f"获取市场数据失败: {str(e)}")
+            self._failed = True
+            self._failures += 1
+            if self._snapshot is not None:
+                logger.info("使用过期缓存数据")
+        finally:
+            self._refresh_lock.release()
+            with self._attempt_done:
+                self._attempts += 1
+                self._attempt_done.notify_all()
+        return self._snapshot
+
+    def trigger(self):
+        """在后台线程中触发一次刷新，不阻塞调用方"""
+        if self._refresh_lock.locked():
+            return
+        threading.Thread(target=self.refresh, kwargs={'block': False}, daemon=True).start()
+
+    def wait_for_version(self, version, timeout=None):
+        """阻塞直到快照版本超过version
+
+        Args:
+            version: 调用方已处理的快照版本
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            MarketSnapshot: 当前快照，超时时可能仍是原版本或为None
+        """
+        self.start()
+        with self._attempt_done:
+            self._attempt_done.wait_for(lambda: self._version > version, timeout)
+        return self._snapshot
+
+    def get(self, wait=True, timeout=None):
+        """获取当前行情快照
+
+        仅在冷启动（尚无任何快照）时阻塞等待首次刷新；快照过期时返回旧快照并在后台刷新。
+
+        Args:
+            wait: 尚无快照时是否阻塞等待首次刷新
+            timeout: 等待首次刷新的最长时间（秒），None表示等到刷新结束
+
+        Returns:
+            MarketSnapshot: 当前快照，获取失败或等待超时时返回None
+        """
+        self.start()
+        self._load_shared()
+        snapshot = self._snapshot
+        if snapshot is None:
+            if not wait:
+                return None
+            if timeout is None:
+                return self.refresh()
+            # 在后台刷新，调用方最多等待timeout秒
+            with self._attempt_done:
+                attempts = self._attempts
+                self.trigger()
+                self._attempt_done.wait_for(lambda: self._attempts > attempts, timeout)
+            return self._snapshot
+        if time.time() - snapshot.timestamp > self.max_age:
+            self.trigger()
+        return snapshot
+
+    def stats(self):
+        """与 cache.TTLCache.stats() 对应的统计信息
+
+        fetches 为本进程请求上游的次数，shared_loads 为载入其他进程刷新结果的次数。
+        """
+        snapshot = self._snapshot
+        return {
+            'entries': len(snapshot) if snapshot is not None else 0,
+            'version': self._version,
+            'ttl': self.max_age,
+            'age': time.time() - snapshot.timestamp if snapshot is not None else None,
+            'fetches': self._fetches,
+            'failures': self._failures,
+            'shared_loads': self._shared_loads
+        }
@@ -0,0 +1,46 @@
+"""为持仓和登录日志的常用查询添加索引
+
+Revision ID: 7c3e1f9a2b64
+Revises: 
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e1f9a2b64'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# (表名, 索引名, 列, 是否唯一)
+INDEXES = [
+    ('user_portfolio', 'ix_user_portfolio_user_id_symbol', ['user_id', 'symbol'], True),
+    ('login_log', 'ix_login_log_login_time', ['login_time'], False),
+    ('login_log', 'ix_login_log_user_id_login_time', ['user_id', 'login_time'], False),
+    ('login_log', 'ix_login_log_status', ['status'], False),
+]
+
+
+def existing_indexes(table):
+    """表上已有的索引名（db.create_all 创建的新库已经包含这些索引）"""
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # 重复的持仓记录只保留最早添加的一条，否则无法建立唯一索引
+    op.execute(
+        'DELETE FROM user_portfolio WHERE id NOT IN '
+        '(SELECT MIN(id) FROM user_portfolio GROUP BY user_id, symbol)'
+    )
+    for table, name, columns, unique in INDEXES:
+        if name not in existing_indexes(table):
+            op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for table, name, columns, unique in reversed(INDEXES):
+        if name in existing_indexes(table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,56 @@
+"""添加按股票代码保存行情和评分的共享快照表
+
+Revision ID: d50219c66740
+Revises: 7c3e1f9a2b64
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd50219c66740'
+down_revision = '7c3e1f9a2b64'
+branch_labels = None
+depends_on = None
+
+
+def existing_tables():
+    """库中已有的表名（db.create_all 创建的新库已经包含快照表）"""
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade():
+    # 旧版持仓JSON中的数据由应用启动时的 migrate_stock_data_to_snapshots 迁移到快照表
+    if 'symbol_snapshot' in existing_tables():
+        return
+    op.create_table(
+        'symbol_snapshot',
+        sa.Column('symbol', sa.String(length=20), nullable=False),
+        sa.Column('industry', sa.String(length=100), nullable=True),
+        sa.Column('current_price', sa.Float(), nullable=True),
+        sa.Column('change_pct', sa.Float(), nullable=True),
+        sa.Column('change_amount', sa.Float(), nullable=True),
+        sa.Column('volume', sa.Float(), nullable=True),
+        sa.Column('turnover', sa.Float(), nullable=True),
+        sa.Column('avg_volume', sa.Float(), nullable=True),
+        sa.Column('score', sa.Integer(), nullable=True),
+        sa.Column('recommendation', sa.String(length=20), nullable=True),
+        sa.Column('trend', sa.String(length=20), nullable=True),
+        sa.Column('rsi', sa.Float(), nullable=True),
+        sa.Column('rsi_signal', sa.String(length=20), nullable=True),
+        sa.Column('macd_signal', sa.String(length=20), nullable=True),
+        sa.Column('volume_trend', sa.String(length=20), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('symbol')
+    )
+    op.create_index('ix_symbol_snapshot_score', 'symbol_snapshot', ['score'], unique=False)
+    op.create_index('ix_symbol_snapshot_updated_at', 'symbol_snapshot', ['updated_at'], unique=False)
+
+
+def downgrade():
+    if 'symbol_snapshot' in existing_tables():
+        op.drop_index('ix_symbol_snapshot_updated_at', table_name='symbol_snapshot')
+        op.drop_index('ix_symbol_snapshot_score', table_name='symbol_snapshot')
+        op.drop_table('symbol_snapshot')
@@ -0,0 +1,61 @@
+"""添加按天和按用户的登录汇总表，并从登录日志回填
+
+Revision ID: ed9904b72b0b
+Revises: d50219c66740
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ed9904b72b0b'
+down_revision = 'd50219c66740'
+branch_labels = None
+depends_on = None
+
+
+def existing_tables():
+    """库中已有的表名（db.create_all 创建的新库已经包含汇总表）"""
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade():
+    tables = existing_tables()
+    if 'login_daily_stat' not in tables:
+        op.create_table(
+            'login_daily_stat',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('day', 'status')
+        )
+        op.execute(
+            "INSERT INTO login_daily_stat (day, status, count) "
+            "SELECT date(login_time), COALESCE(status, 'success'), COUNT(*) FROM login_log "
+            "GROUP BY date(login_time), COALESCE(status, 'success')"
+        )
+    if 'user_login_stat' not in tables:
+        op.create_table(
+            'user_login_stat',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+            sa.PrimaryKeyConstraint('user_id', 'day', 'status')
+        )
+        op.execute(
+            "INSERT INTO user_login_stat (user_id, day, status, count) "
+            "SELECT user_id, date(login_time), COALESCE(status, 'success'), COUNT(*) FROM login_log "
+            "GROUP BY user_id, date(login_time), COALESCE(status, 'success')"
+        )
+
+
+def downgrade():
+    tables = existing_tables()
+    if 'user_login_stat' in tables:
+        op.drop_table('user_login_stat')
+    if 'login_daily_stat' in tables:
+        op.drop_table('login_daily_stat')
@@ -3,6 +3,8 @@ from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timezone
 import json
+import math
+import hashlib
 import pytz
 
 db = SQLAlchemy()
@@ -28,6 +30,9 @@ class User(UserMixin, db.Model):
     # 一对多关系：一个用户有多个登录记录
     login_logs = db.relationship('LoginLog', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     
+    # 一对多关系：一个用户有多条登录汇总
+    login_stats = db.relationship('UserLoginStat', backref='user', lazy='dynamic', cascade='all, delete-orphan')
+    
     # 一对多关系：一个用户有多个股票
     portfolios = db.relationship('UserPortfolio', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     
@@ -52,6 +57,12 @@ class User(UserMixin, db.Model):
 
 class LoginLog(db.Model):
     """用户登录日志模型"""
+    __table_args__ = (
+        db.Index('ix_login_log_login_time', 'login_time'),
+        db.Index('ix_login_log_user_id_login_time', 'user_id', 'login_time'),
+        db.Index('ix_login_log_status', 'status'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     login_time = db.Column(db.DateTime, default=get_beijing_time)
@@ -62,8 +73,32 @@ class LoginLog(db.Model):
     def __repr__(self):
         return f'<LoginLog {self.user_id} {self.login_time}>'
 
+class LoginDailyStat(db.Model):
+    """按天、按状态汇总的登录次数"""
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)  # success, failed
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<LoginDailyStat {self.day} {self.status} {self.count}>'
+
+class UserLoginStat(db.Model):
+    """按用户、按天、按状态汇总的登录次数"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)  # success, failed
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<UserLoginStat {self.user_id} {self.day} {self.status} {self.count}>'
+
 class UserPortfolio(db.Model):
     """用户股票投资组合模型"""
+    __table_args__ = (
+        # 同一用户的同一只股票只能有一条记录，同时用于按 (user_id, symbol) 查询
+        db.Index('ix_user_portfolio_user_id_symbol', 'user_id', 'symbol', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     symbol = db.Column(db.String(20), nullable=False)  # 股票代码
@@ -82,4 +117,84 @@ class UserPortfolio(db.Model):
         self.stock_data = json.dumps(data, ensure_ascii=False)
     
     def __repr__(self):
-        return f'<UserPortfolio {self.user_id} {self.symbol}>' 
\ No newline at end of file
+        return f'<UserPortfolio {self.user_id} {self.symbol}>' 
+
+class SymbolSnapshot(db.Model):
+    """按股票代码保存的最新行情和评分，所有持有该股票的用户共享"""
+    symbol = db.Column(db.String(20), primary_key=True)  # 股票代码
+    industry = db.Column(db.String(100))
+    current_price = db.Column(db.Float)
+    change_pct = db.Column(db.Float)
+    change_amount = db.Column(db.Float)
+    volume = db.Column(db.Float)
+    turnover = db.Column(db.Float)
+    avg_volume = db.Column(db.Float)
+    score = db.Column(db.Integer, index=True)
+    recommendation = db.Column(db.String(20))
+    trend = db.Column(db.String(20))
+    rsi = db.Column(db.Float)
+    rsi_signal = db.Column(db.String(20))
+    macd_signal = db.Column(db.String(20))
+    volume_trend = db.Column(db.String(20))
+    updated_at = db.Column(db.DateTime, index=True)
+    
+    # 与持仓dict同名的字段
+    FIELDS = (
+        'industry', 'current_price', 'change_pct', 'change_amount', 'volume', 'turnover', 'avg_volume',
+        'score', 'recommendation', 'trend', 'rsi', 'rsi_signal', 'macd_signal', 'volume_trend'
+    )
+    
+    # last_update 的格式
+    TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+    
+    @staticmethod
+    def _column_value(value):
+        """字段值转换为写入数据库的形式：numpy数值转换为Python数值，NaN（如停牌股票的行情）转换为None"""
+        if hasattr(value, 'item'):
+            value = value.item()
+        if isinstance(value, float) and math.isnan(value):
+            return None
+        return value
+    
+    @classmethod
+    def content_hash(cls, data):
+        """行情和评分字段的内容哈希，不含更新时间
+        
+        Args:
+            data: 包含 FIELDS 字段的dict
+        """
+        values = []
+        for field in cls.FIELDS:
+            value = cls._column_value(data.get(field))
+            # 数据库读出的整数和计算得到的浮点数按同一形式比较，NaN与数据库中的NULL一致
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = float(value)
+            values.append(value)
+        return hashlib.sha1(json.dumps(values, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def to_mapping(cls, symbol, stock):
+        """持仓dict转换为批量写入用的列映射"""
+        mapping = {'symbol': symbol}
+        for field in cls.FIELDS:
+            mapping[field] = cls._column_value(stock.get(field))
+        last_update = stock.get('last_update')
+        if last_update:
+            try:
+                mapping['updated_at'] = datetime.strptime(last_update, cls.TIME_FORMAT)
+            except (TypeError, ValueError):
+                pass
+        return mapping
+    
+    def to_dict(self):
+        """转换为持仓dict中的字段
+
+        始终包含 FIELDS 中的全部字段，缺失的值（如停牌股票的行情）为None。
+        """
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        if self.updated_at is not None:
+            data['last_update'] = self.updated_at.strftime(self.TIME_FORMAT)
+        return data
+    
+    def __repr__(self):
+        return f'<SymbolSnapshot {self.symbol}>'
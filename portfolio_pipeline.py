@@ -0,0 +1,107 @@
+import time
+import logging
+from models import get_beijing_time
+
+logger = logging.getLogger(__name__)
+
+# 从行情快照写入持仓的字段
+QUOTE_FIELDS = ('current_price', 'change_pct', 'change_amount', 'volume', 'turnover')
+
+# 评分结果写入持仓的字段
+SCORE_FIELDS = ('score', 'recommendation', 'trend', 'rsi_signal', 'macd_signal', 'volume_trend')
+
+
+class PortfolioPipeline:
+    """持仓批量估值流水线
+
+    一次处理一组持仓：批量查行情 -> 批量同步日线 -> 技术指标（按股票代码共享缓存）-> 评分。
+    K线不足或技术指标计算失败的股票回退到基于行情的简化评分。
+    每个阶段的耗时记录在 last_timings 中并写入日志。
+    """
+
+    def __init__(self, history_store, analysis_cache, fallback_score):
+        """
+        Args:
+            history_store: HistoryStore，日线的来源
+            analysis_cache: SymbolAnalysisCache，共享的技术分析结果
+            fallback_score: 简化评分函数，参数为持仓dict，返回包含 SCORE_FIELDS 的dict
+        """
+        self.history_store = history_store
+        self.analysis_cache = analysis_cache
+        self.fallback_score = fallback_score
+        self.last_timings = {}
+
+    def run(self, stocks, market_data, sync=True):
+        """就地更新持仓的行情和评分
+
+        没有行情的股票保持原样。
+
+        Args:
+            stocks: 持仓dict列表，至少包含 symbol
+            market_data: MarketSnapshot
+            sync: 是否先尝试增量同步日线，为False时只使用本地已有日线
+
+        Returns:
+            dict: 阶段名 -> 耗时（秒）
+        """
+        timings = {}
+        started = time.perf_counter()
+
+        def mark(stage):
+            nonlocal started
+            now = time.perf_counter()
+            timings[stage] = now - started
+            started = now
+
+        quotes = market_data.get_quotes([stock['symbol'] for stock in stocks])
+        mark('quotes')
+
+        symbols = list(quotes)
+        if sync:
+            self.history_store.sync_many(symbols)
+            mark('history_sync')
+
+        try:
+            analyses = self.analysis_cache.get_many(symbols, sync=False)
+        except Exception as e:
+            logger.error(f"批量计算技术指标失败: {str(e)}")
+            analyses = {}
+        mark('indicators')
+
+        last_update = get_beijing_time().strftime('%Y-%m-%d %H:%M:%S')
+        for stock in stocks:
+            quote = quotes.get(stock['symbol'])
+            if quote is not None:
+                self._apply(stock, quote, analyses.get(stock['symbol']), last_update)
+        mark('scoring')
+
+        timings['total'] = sum(timings.values())
+        self.last_timings = timings
+        logger.info(
+            f"持仓估值 {len(stocks)} 只（行情 {len(quotes)} 只）: " +
+            ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in timings.items())
+        )
+        return timings
+
+    def _apply(self, stock, quote, entry, last_update):
+        """将行情和评分写入单只持仓"""
+        for field in QUOTE_FIELDS:
+            stock[field] = quote[field]
+        stock['last_update'] = last_update
+
+        analysis_result = entry.get('analysis_result') if entry else None
+        if analysis_result is not None:
+            # 平均成交量，用于判断放量/缩量
+            if entry.get('avg_volume') is not None:
+                stock['avg_volume'] = entry['avg_volume']
+            # 与详细分析页面相同的评分逻辑，保存详细分析结果
+            stock['analysis_result'] = analysis_result
+            for field in SCORE_FIELDS:
+                stock[field] = analysis_result[field]
+            stock['rsi'] = analysis_result['rsi']
+            return
+
+        # 无法计算技术指标时，回退到简化评分
+        result = self.fallback_score(stock)
+        for field in SCORE_FIELDS:
+            stock[field] = result[field]
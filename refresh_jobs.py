@@ -0,0 +1,222 @@
+import time
+import uuid
+import pickle
+import threading
+import logging
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+# 单只股票的刷新状态
+STATUS_PENDING = 'pending'
+STATUS_DONE = 'done'
+STATUS_NO_QUOTE = 'no_quote'
+STATUS_ERROR = 'error'
+
+
+class RefreshJob:
+    """一次后台持仓刷新任务的进度"""
+
+    def __init__(self, user_id, symbols):
+        self.job_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.state = 'queued'
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.status = {symbol: STATUS_PENDING for symbol in symbols}
+        self.results = {}
+        # 已写入共享存储的结果分块数和结果数
+        self.chunks = 0
+        self._published = 0
+        self._lock = threading.Lock()
+        self._on_change = None
+
+    def __getstate__(self):
+        # 写入共享存储的任务头不包含锁、回调和结果，结果按分块单独写入
+        with self._lock:
+            state = self.__dict__.copy()
+        del state['_lock'], state['_on_change'], state['results']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.results = {}
+        self._lock = threading.Lock()
+        self._on_change = None
+
+    @property
+    def total(self):
+        return len(self.status)
+
+    @property
+    def done(self):
+        return sum(1 for status in self.status.values() if status != STATUS_PENDING)
+
+    @property
+    def active(self):
+        return self.state in ('queued', 'running')
+
+    def complete(self, symbol, status, stock=None):
+        """记录一只股票的刷新结果（本进程内立即可见，其他进程在 publish 后可见）"""
+        with self._lock:
+            self.status[symbol] = status
+            if stock is not None:
+                self.results[symbol] = dict(stock)
+
+    def publish(self):
+        """把进度和新完成的结果写入共享存储，每批股票完成后调用一次"""
+        if self._on_change is not None:
+            self._on_change(self)
+
+    def to_dict(self, since=0):
+        """进度信息，供JSON接口返回
+
+        Args:
+            since: 只返回第since个之后完成的股票数据，便于页面增量更新
+        """
+        with self._lock:
+            results = list(self.results.items())[since:]
+            return {
+                'job_id': self.job_id,
+                'state': self.state,
+                'error': self.error,
+                'done': self.done,
+                'total': self.total,
+                'status': dict(self.status),
+                'stocks': dict(results),
+                'next': since + len(results)
+            }
+
+
+class RefreshJobManager:
+    """后台持仓刷新任务
+
+    刷新在有界线程池中执行，请求提交后立即返回任务ID，
+    页面通过进度接口轮询每只股票的状态和已完成的结果。
+    同一用户同时只有一个进行中的任务，重复提交返回已有任务。
+    指定共享存储时，任务状态和每只股票的进度在每批完成后写入存储，多进程部署下由其他进程处理的进度查询也能读到；
+    已完成的结果只追加写入新的分块，不重复写入之前的结果。
+    """
+
+    def __init__(self, run, max_workers=2, ttl=3600, store=None):
+        """
+        Args:
+            run: 执行任务的函数，参数为 RefreshJob
+            max_workers: 同时执行的任务数
+            ttl: 已结束任务的保留时间（秒）
+            store: 共享存储（shared_cache.FileStore 等），None表示任务只保存在本进程
+        """
+        self._run = run
+        self.ttl = ttl
+        self._store = store
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='refresh-job'
+        )
+
+    def submit(self, user_id, symbols):
+        """提交刷新任务
+
+        Returns:
+            RefreshJob: 新任务，或该用户进行中的任务
+        """
+        with self._lock:
+            self._prune()
+            for job in self._jobs.values():
+                if job.user_id == user_id and job.active:
+                    return job
+            job = RefreshJob(user_id, symbols)
+            job._on_change = self._publish
+            self._jobs[job.job_id] = job
+        self._publish(job)
+        self._executor.submit(self._execute, job)
+        return job
+
+    def get(self, job_id, user_id=None):
+        """按任务ID获取任务，指定user_id时只返回该用户的任务"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = self._load(job_id)
+        if job is None or (user_id is not None and job.user_id != user_id):
+            return None
+        return job
+
+    @staticmethod
+    def _key(job_id, chunk=None):
+        return f'refresh_job_{job_id}' if chunk is None else f'refresh_job_{job_id}_{chunk}'
+
+    def _publish(self, job):
+        """把任务进度写入共享存储
+
+        上次写入之后完成的结果写为一个新分块，再写入引用全部分块的任务头，
+        读取方看到任务头时其引用的分块都已存在。
+        """
+        if self._store is None:
+            return
+        try:
+            with job._lock:
+                pending = list(job.results.items())[job._published:]
+            if pending:
+                self._store.set(
+                    self._key(job.job_id, job.chunks),
+                    pickle.dumps(pending, protocol=pickle.HIGHEST_PROTOCOL)
+                )
+                job.chunks += 1
+                job._published += len(pending)
+            self._store.set(self._key(job.job_id), pickle.dumps(job, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception as e:
+            logger.error(f"保存刷新任务 {job.job_id} 进度失败: {str(e)}")
+
+    def _load(self, job_id):
+        """从共享存储读取其他进程的任务，返回只读副本"""
+        if self._store is None or not job_id.isalnum():
+            return None
+        buffer = self._store.get(self._key(job_id))
+        if buffer is None:
+            return None
+        try:
+            job = pickle.loads(buffer)
+            if job.finished_at is not None and time.time() - job.finished_at > self.ttl:
+                return None
+            for chunk in range(job.chunks):
+                job.results.update(pickle.loads(self._store.get(self._key(job_id, chunk))))
+        except Exception as e:
+            logger.error(f"读取刷新任务 {job_id} 进度失败: {str(e)}")
+            return None
+        return job
+
+    def _execute(self, job):
+        job.state = 'running'
+        self._publish(job)
+        started = time.time()
+        try:
+            self._run(job)
+            job.state = 'done'
+        except Exception as e:
+            logger.error(f"刷新任务 {job.job_id} 失败: {str(e)}")
+            job.error = str(e)
+            job.state = 'failed'
+            for symbol, status in list(job.status.items()):
+                if status == STATUS_PENDING:
+                    job.complete(symbol, STATUS_ERROR)
+        finally:
+            job.finished_at = time.time()
+            self._publish(job)
+            logger.info(f"刷新任务 {job.job_id} 结束（{job.state}），{job.done}/{job.total}，耗时 {job.finished_at - started:.2f} 秒")
+
+    def _prune(self):
+        """清理超过保留时间的已结束任务"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.ttl
+        ]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            if self._store is not None:
+                self._store.delete(self._key(job_id))
+                for chunk in range(job.chunks):
+                    self._store.delete(self._key(job_id, chunk))
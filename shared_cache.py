@@ -0,0 +1,226 @@
+import os
+import mmap
+import time
+import pickle
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 flock，只能使用进程内存储
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class LocalStore:
+    """进程内存储，单进程部署或平台不支持文件锁时使用
+
+    接口与 FileStore 相同：get/set/delete 读写字节，stamp 返回变更标记，lock 选出唯一的刷新者。
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        return entry[1] if entry is not None else None
+
+    def set(self, key, data):
+        self._data[key] = (time.time_ns(), bytes(data))
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def stamp(self, key):
+        entry = self._data.get(key)
+        return entry[0] if entry is not None else None
+
+    @contextmanager
+    def lock(self, key, blocking=True):
+        """获取key的刷新锁，yield 是否获取成功"""
+        with self._guard:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        acquired = key_lock.acquire(blocking)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                key_lock.release()
+
+
+class FileStore:
+    """基于文件的跨进程存储
+
+    每个key一个文件，写入时先写临时文件再原子替换，读取方始终看到完整的版本；
+    读取使用mmap，多个工作进程共享操作系统页缓存中的同一份数据。
+    刷新锁使用 flock，进程退出时由操作系统自动释放。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """返回只读mmap，文件不存在或为空时返回None"""
+        try:
+            with open(self._path(key), 'rb') as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def set(self, key, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f'.{key}.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, key):
+        """删除key对应的文件，不存在时忽略"""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def stamp(self, key):
+        """文件被替换或修改后变化的标记，文件不存在时返回None"""
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    @contextmanager
+    def lock(self, key, blocking=True):
+        """获取key的跨进程刷新锁，yield 是否获取成功
+
+        每次获取都重新打开锁文件，同一进程内的不同线程之间同样互斥。
+        """
+        with open(self._path(f'{key}.lock'), 'a+b') as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+            except BlockingIOError:
+                acquired = False
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def create_store(backend, directory):
+    """按配置创建共享存储
+
+    Args:
+        backend: 'file' 或 'local'
+        directory: FileStore 的目录
+    """
+    if backend == 'file':
+        if fcntl is None:
+            logger.warning("当前平台不支持文件锁，共享缓存改为进程内存储")
+            return LocalStore()
+        return FileStore(directory)
+    if backend == 'local':
+        return LocalStore()
+    raise ValueError(f"不支持的共享缓存后端: {backend}")
+
+
+class SharedValue:
+    """存放在共享存储中的缓存值（pickle序列化）
+
+    过期后只有获得刷新锁的进程重新计算，其余进程继续返回旧值；
+    尚无任何值时，其余进程等待刷新完成后直接读取结果。
+    """
+
+    def __init__(self, store, key, max_age):
+        self.store = store
+        self.key = key
+        self.max_age = max_age
+        self._stamp = None
+        self._value = None
+        self._timestamp = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _read(self):
+        """读取共享存储中的最新值，未变化时复用已反序列化的结果"""
+        stamp = self.store.stamp(self.key)
+        if stamp is not None and stamp != self._stamp:
+            buffer = self.store.get(self.key)
+            if buffer is not None:
+                try:
+                    self._timestamp, self._value = pickle.loads(buffer)
+                    self._stamp = stamp
+                except Exception as e:
+                    logger.error(f"读取共享缓存 {self.key} 失败: {str(e)}")
+        return self._value, self._timestamp
+
+    @property
+    def timestamp(self):
+        """当前值的计算时间，没有值时为0"""
+        return self._read()[1]
+
+    def get_or_compute(self, compute, force=False):
+        """返回缓存值，过期或强制刷新时重新计算
+
+        Args:
+            compute: 计算新值的函数，抛出异常时保留旧值
+            force: 是否强制刷新
+
+        Returns:
+            缓存值，从未成功计算过时为None
+        """
+        requested_at = time.time()
+        value, timestamp = self._read()
+        if value is not None and not force and requested_at - timestamp <= self.max_age:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        with self.store.lock(self.key, blocking=value is None) as acquired:
+            if not acquired:
+                # 其他进程正在刷新，先返回旧值
+                self.stale += 1
+                return value
+            # 等锁期间其他进程可能已完成刷新
+            value, timestamp = self._read()
+            if value is not None and (timestamp >= requested_at or (not force and time.time() - timestamp <= self.max_age)):
+                return value
+            try:
+                new_value = compute()
+            except Exception as e:
+                logger.error(f"刷新共享缓存 {self.key} 失败: {str(e)}")
+                return value
+            computed_at = time.time()
+            self.store.set(self.key, pickle.dumps((computed_at, new_value), protocol=pickle.HIGHEST_PROTOCOL))
+            self._stamp = self.store.stamp(self.key)
+            self._value = new_value
+            self._timestamp = computed_at
+            return new_value
+
+    def stats(self):
+        """与 cache.TTLCache.stats() 对应的统计信息，stale 为刷新期间返回旧值的次数"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': 1 if self._value is not None else 0,
+            'ttl': self.max_age,
+            'age': time.time() - self._timestamp if self._value is not None else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None,
+            'stale': self.stale
+        }
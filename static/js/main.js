@@ -78,21 +78,16 @@ function formatPercent(num) {
     return (num > 0 ? '+' : '') + num.toFixed(2) + '%';
 }
 
-// 模拟API调用函数
+// 获取单只股票的行情、技术分析和财务指标
+// 接口带ETag，数据未变化时浏览器用本地缓存（服务器返回304）
 function fetchStockData(symbol, callback) {
-    // 模拟API延迟
-    setTimeout(() => {
-        // 模拟数据
-        const data = {
-            symbol: symbol,
-            name: `${symbol} 公司`,
-            price: 120.45 + (Math.random() * 10 - 5),
-            change: 2.3 + (Math.random() * 2 - 1),
-            volume: 3245678 + (Math.random() * 1000000 - 500000),
-            market_cap: "1.2T",
-            pe_ratio: 22.5 + (Math.random() * 5 - 2.5)
-        };
-        
-        callback(data);
-    }, 500);
+    fetch(`/api/v1/analysis/${encodeURIComponent(symbol)}`, {headers: {'Accept': 'application/json'}})
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`获取股票数据失败: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => callback(data))
+        .catch(error => console.error(error));
 } 
\ No newline at end of file
@@ -0,0 +1,33 @@
+import os
+import tempfile
+import pytest
+
+# 测试使用临时目录中的数据库，不修改仓库中的 app.db 和 market.db
+_tmp_dir = tempfile.mkdtemp(prefix='stock-tests-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmp_dir, 'app.db')}")
+os.environ.setdefault('MARKET_DB_PATH', os.path.join(_tmp_dir, 'market.db'))
+os.environ.setdefault('SHARED_CACHE_BACKEND', 'local')
+os.environ.setdefault('LOGIN_AUDIT_DURABILITY', 'sync')
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """导入应用模块（依赖 akshare，未安装时跳过）"""
+    pytest.importorskip('akshare')
+    import app as app_module
+    app_module.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app_module
+
+
+@pytest.fixture
+def admin_client(app_module):
+    """以默认管理员登录的测试客户端，测试结束后清空其持仓"""
+    from models import db, User, UserPortfolio
+    client = app_module.app.test_client()
+    response = client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302
+    yield client
+    with app_module.app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        UserPortfolio.query.filter_by(user_id=admin.id).delete()
+        db.session.commit()
@@ -0,0 +1,33 @@
+import json
+import math
+import numpy as np
+from chart_data import json_safe
+
+
+def test_nan_quote_row_serializes_as_strict_json():
+    # 停牌股票：行情快照中的价格、涨跌幅为NaN
+    stock = {
+        'symbol': '600001',
+        'name': '停牌股票',
+        'current_price': float('nan'),
+        'change_pct': np.float64('nan'),
+        'change_amount': np.nan,
+        'volume': np.float64(0.0),
+        'turnover': float('inf'),
+        'score': np.int64(50),
+        'analysis_result': {'rsi': float('nan'), 'signals': [1.5, float('nan')]}
+    }
+    body = {'snapshot_version': 3, 'stocks': [stock]}
+
+    text = json.dumps(json_safe(body), allow_nan=False)
+    parsed = json.loads(text)['stocks'][0]
+
+    assert parsed['current_price'] is None
+    assert parsed['change_pct'] is None
+    assert parsed['change_amount'] is None
+    assert parsed['turnover'] is None
+    assert parsed['volume'] == 0.0
+    assert parsed['score'] == 50
+    assert parsed['analysis_result'] == {'rsi': None, 'signals': [1.5, None]}
+    # 原数据不被修改
+    assert math.isnan(stock['current_price'])
@@ -0,0 +1,75 @@
+import time
+import threading
+from models import db, User, UserPortfolio, SymbolSnapshot
+
+
+def add_holdings(app_module, holdings):
+    """为管理员添加持仓，holdings 为 (股票代码, 名称, 快照字段或None) 列表"""
+    with app_module.app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        for symbol, name, snapshot in holdings:
+            db.session.add(UserPortfolio(user_id=admin.id, symbol=symbol, name=name))
+            if snapshot is not None:
+                db.session.merge(SymbolSnapshot(symbol=symbol, **snapshot))
+        db.session.commit()
+
+
+def test_snapshot_with_null_quotes_has_every_field():
+    # 停牌股票的行情字段以NULL保存
+    snapshot = SymbolSnapshot(symbol='600001', score=40, recommendation='观望')
+    data = snapshot.to_dict()
+
+    assert set(SymbolSnapshot.FIELDS) <= set(data)
+    assert data['change_pct'] is None
+    assert data['volume'] is None
+    assert data['score'] == 40
+
+
+def test_stocks_page_renders_null_quote_rows_from_db(app_module, admin_client, monkeypatch):
+    # 没有行情快照时页面直接显示数据库中的快照
+    monkeypatch.setattr(app_module, 'get_market_data', lambda timeout=None: None)
+    add_holdings(app_module, [
+        ('600001', '停牌股票', {'score': 40, 'recommendation': '观望'}),
+        ('600002', '刚添加的股票', None),
+    ])
+
+    response = admin_client.get('/stocks')
+
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert '停牌股票' in html
+    assert '刚添加的股票' in html
+
+
+def test_refresh_redirect_renders_stored_rows_while_job_runs(app_module, admin_client, monkeypatch):
+    # 刷新任务在获取行情处阻塞，保证重定向后的页面在任务进行中渲染
+    release = threading.Event()
+
+    def blocked_market_data(timeout=None):
+        release.wait(5)
+        return None
+
+    monkeypatch.setattr(app_module, 'get_market_data', blocked_market_data)
+    monkeypatch.setattr(app_module.market_refresher, 'trigger', lambda: None)
+    add_holdings(app_module, [
+        ('600003', '停牌股票', {'score': 40, 'recommendation': '观望'}),
+        ('600004', '刚添加的股票', None),
+    ])
+
+    try:
+        response = admin_client.get('/refresh_stocks')
+        assert response.status_code == 302
+        assert '/stocks?job=' in response.headers['Location']
+        job_id = response.headers['Location'].split('job=')[1]
+        assert app_module.refresh_jobs.get(job_id).active
+
+        page = admin_client.get(response.headers['Location'])
+        assert page.status_code == 200
+        html = page.get_data(as_text=True)
+        assert '停牌股票' in html
+        assert job_id in html
+    finally:
+        release.set()
+        deadline = time.time() + 5
+        while app_module.refresh_jobs.get(job_id).active and time.time() < deadline:
+            time.sleep(0.05)